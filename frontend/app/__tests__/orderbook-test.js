@@ -0,0 +1,81 @@
+jest.dontMock('../js/orderbook');
+
+describe('orderbook', function() {
+ var OrderBook = require('../js/orderbook');
+
+ var prices = function(book) {
+   return book.toArray().map(function(trade) {
+     return trade.price;
+   });
+ };
+
+ it('keeps buys sorted highest price first', function() {
+   var book = new OrderBook(true);
+   book.insert({id: 'a', price: 1});
+   book.insert({id: 'b', price: 3});
+   book.insert({id: 'c', price: 2});
+   book.insert({id: 'd', price: 3});
+   expect(prices(book)).toEqual([3, 3, 2, 1]);
+   expect(book.toArray()[0].id).toEqual('b');
+   expect(book.toArray()[1].id).toEqual('d');
+ });
+
+ it('keeps sells sorted lowest price first', function() {
+   var book = new OrderBook(false);
+   book.reset([{id: 'a', price: 2}, {id: 'b', price: 1}, {id: 'c', price: 2}]);
+   book.insert({id: 'd', price: 1.5});
+   expect(prices(book)).toEqual([1, 1.5, 2, 2]);
+   expect(book.toArray()[2].id).toEqual('a');
+ });
+
+ it('removes and updates trades by id', function() {
+   var book = new OrderBook(true);
+   book.reset([{id: 'a', price: 2}, {id: 'b', price: 2}, {id: 'c', price: 1}]);
+
+   expect(book.remove('b').id).toEqual('b');
+   expect(book.remove('b')).toEqual(null);
+   expect(book.get('b')).toBeUndefined();
+   expect(prices(book)).toEqual([2, 1]);
+
+   book.update({id: 'a', price: 2, amount: 5});
+   expect(book.toArray()[0].amount).toEqual(5);
+
+   book.update({id: 'c', price: 3});
+   expect(book.toArray().map(function(trade) {
+     return trade.id;
+   })).toEqual(['c', 'a']);
+ });
+
+ it('ranks trades by id and price', function() {
+   var book = new OrderBook(false);
+   book.reset([{id: 'a', price: 2}, {id: 'b', price: 1}, {id: 'c', price: 2}]);
+   expect(book.indexOf('b')).toEqual(0);
+   expect(book.indexOf('c')).toEqual(2);
+   expect(book.indexOf('x')).toEqual(-1);
+   expect(book.search(2, true)).toEqual(1);
+   expect(book.search(2, false)).toEqual(3);
+ });
+
+ it('stays sorted through many inserts and removes', function() {
+   var book = new OrderBook(true);
+   var expected = [];
+
+   for (var i = 0; i < 500; i++) {
+     var trade = {id: 't' + i, price: (i * 7919) % 37};
+     book.insert(trade);
+     expected.push(trade);
+   }
+   for (var i = 0; i < 500; i += 3) {
+     book.remove('t' + i);
+     expected[i] = null;
+   }
+
+   expected = expected.filter(function(trade) {
+     return trade;
+   }).sort(function(a, b) {
+     return b.price - a.price || Number(a.id.slice(1)) - Number(b.id.slice(1));
+   });
+   expect(book.toArray()).toEqual(expected);
+   expect(book.indexOf(expected[100].id)).toEqual(100);
+ });
+});
@@ -8,17 +8,8 @@ var MarketActions = function(client) {
 
         var user = this.flux.store("UserStore").getState().user;
 
+        // Per market balances come along with the markets
         _client.loadMarkets(user, function(markets) {
-            var user = this.flux.store("UserStore").getState().user;
-            // Load per market balances
-            for (var i = 0; i < markets.length; i++) {
-                _client.updateBalanceSub(markets[i], user.addresses[0], function(market, available, trading, balance) {
-                    this.flux.actions.market.updateMarketBalance(market, available, trading, balance);
-                }.bind(this), function(error) {
-                    this.dispatch(constants.market.LOAD_MARKETS_FAIL, {error: error});
-                }.bind(this));
-            };
-
             this.dispatch(constants.market.LOAD_MARKETS_SUCCESS, markets);
 
             // Load user sub balances
@@ -57,15 +48,6 @@ var MarketActions = function(client) {
 
         _client.loadMarkets(user, function(markets) {
             this.dispatch(constants.market.UPDATE_MARKET);
-            var user = this.flux.store("UserStore").getState().user;
-            // Load per market balances
-            for (var i = 0; i < markets.length; i++) {
-                _client.updateBalanceSub(markets[i], user.addresses[0], function(market, available, trading, balance) {
-                    this.flux.actions.market.updateMarketBalance(market, available, trading, balance);
-                }.bind(this), function(error) {
-                    this.dispatch(constants.market.LOAD_MARKETS_FAIL, {error: error});
-                }.bind(this));
-            };
             this.dispatch(constants.market.LOAD_MARKETS_SUCCESS, markets);
 
             // Update sub balances after loading addresses
@@ -10,22 +10,32 @@ var TradeActions = function(client) {
 
         _client.loadTrades(this.flux, market, function(progress) {
             this.dispatch(constants.trade.LOAD_TRADES_PROGRESS, progress);
-        }.bind(this), function(trades) {
-            this.dispatch(constants.trade.LOAD_TRADES_SUCCESS, trades);
+        }.bind(this), function(trades, block) {
+            this.dispatch(constants.trade.LOAD_TRADES_SUCCESS, {
+                market: market,
+                block: block,
+                trades: trades
+            });
         }.bind(this), function(error) {
             this.dispatch(constants.trade.LOAD_TRADES_FAIL, {error: error});
         }.bind(this));
     };
 
     this.updateTrades = function() {
-        this.dispatch(constants.trade.UPDATE_TRADES);
-
         var market = this.flux.store("MarketStore").getState().market;
+        var book = this.flux.store("TradeStore").getBook(market.id);
 
-        _client.loadTrades(this.flux, market, function(progress) {
-            this.dispatch(constants.trade.UPDATE_TRADES_PROGRESS, progress);
-        }.bind(this), function(trades) {
-            this.dispatch(constants.trade.UPDATE_TRADES_SUCCESS, trades);
+        // Load a snapshot of the book first, then only apply changes
+        if (!book) {
+            this.flux.actions.trade.loadTrades();
+            return;
+        }
+
+        this.dispatch(constants.trade.UPDATE_TRADES);
+
+        _client.syncTrades(market, book.block, function(changes) {
+            changes.market = market;
+            this.dispatch(constants.trade.UPDATE_TRADES_SUCCESS, changes);
 
             // Highlight filling trades
             var trade = this.flux.store("TradeStore").getState();
@@ -23,6 +23,11 @@ web3.padDecimal = function (string, chars) {
     return Array(chars - string.length + 1).join("0") + string;
 };
 
+web3.padHex = function (string, chars) {
+    string = string.substr(0, 2) == "0x" ? string.substr(2) : string;
+    return Array(chars - string.length + 1).join("0") + string;
+};
+
 var EthereumClient = function() {
 
     // Loading methods
@@ -50,64 +55,83 @@ var EthereumClient = function() {
 
     this.loadMarkets = function(user, success, failure) {
         try {
-            web3.eth.stateAt(fixtures.addresses.etherex, "0x5").then(function (hextotal) {
-                var total = _.parseInt(web3.toDecimal(hextotal));
+            // Every market header with the user's available and trading balances, in one call
+            var calldata = "0x10" + web3.padHex(user.addresses[0], 64);
+
+            web3.eth.call({to: fixtures.addresses.etherex, data: calldata}).then(function (raw_summary) {
+                var fields = [];
+                raw_summary = raw_summary.substr(2);
+
+                while (raw_summary.length >= 64) {
+                    fields.push("0x" + raw_summary.slice(0, 64));
+                    raw_summary = raw_summary.slice(64);
+                };
+
+                var total = Math.floor(fields.length / fixtures.summary_fields);
 
-                // console.log("TOTAL MARKETS: ", total, hextotal);
+                // console.log("TOTAL MARKETS: ", total);
 
-                if (!total || hextotal == "0x") {
+                if (!total) {
                     failure("No market found, seems like contracts are missing.");
                     return;
                 }
 
                 var marketPromises = [];
 
-                for (var id = 1; id < total + 1; id++) {
+                for (var i = 0; i < total; i++) {
                     var marketPromise = new Promise(function (resolve, reject) {
-                        contract.get_market(String(id)).call().then(function (market) {
-                            try {
-                                // console.log("Market from ABI:", market);
-
-                                var id = _.parseInt(market[0]);
-                                var name = web3.toAscii(market[1]); // .replace(/[^a-zA-Z0-9]/g,'');
-                                var address = market[2].replace("0x000000000000000000000000", "0x");
-                                var decimals = _.parseInt(market[3]);
-                                var precision = _.parseInt(market[4]);
-                                var minimum = _.parseInt(market[5]);
-                                if (market[6] == 1)
-                                    var lastPrice = null;
-                                else
-                                    var lastPrice = parseFloat(bigRat(market[6]).divide(bigRat(Math.pow(10, market[4].length - 1))).toDecimal());
-                                var owner = market[7].replace("0x000000000000000000000000", "0x");
-                                var block = _.parseInt(market[8]);
-                                var total_trades = _.parseInt(market[9]);
-
-                                // console.log(id, name, address, decimals, precision, minimum, lastPrice, owner, block);
-
-                                web3.eth.stateAt(address, user.addresses[0]).then(function (balance) {
-                                    resolve({
-                                        id: id,
-                                        name: name,
-                                        address: address,
-                                        decimals: decimals,
-                                        minimum: minimum,
-                                        precision: precision,
-                                        lastPrice: lastPrice,
-                                        owner: owner,
-                                        block: block,
-                                        total_trades: total_trades,
-                                        balance: _.parseInt(balance),
-                                    });
-                                }, function(e) {
-                                    reject("Unable to get market balance: " + String(e));
+                        var market = fields.slice(i * fixtures.summary_fields, (i + 1) * fixtures.summary_fields);
+
+                        try {
+                            // console.log("Market from summary:", market);
+
+                            var id = _.parseInt(web3.toDecimal(market[0]));
+                            var name = web3.toAscii(market[1]); // .replace(/[^a-zA-Z0-9]/g,'');
+                            var address = market[2].replace("0x000000000000000000000000", "0x");
+                            var decimals = _.parseInt(web3.toDecimal(market[3]));
+                            var precision = web3.toDecimal(market[4]);
+                            var minimum = web3.toDecimal(market[5]);
+                            var last_price = web3.toDecimal(market[6]);
+                            if (last_price == 1)
+                                var lastPrice = null;
+                            else
+                                var lastPrice = parseFloat(bigRat(last_price).divide(bigRat(Math.pow(10, precision.length - 1))).toDecimal());
+                            var owner = market[7].replace("0x000000000000000000000000", "0x");
+                            var block = _.parseInt(web3.toDecimal(market[8]));
+                            var total_trades = _.parseInt(web3.toDecimal(market[9]));
+                            var available = bigRat(web3.toDecimal(market[10])).divide(bigRat(String(Math.pow(10, decimals)))).valueOf();
+                            var trading = bigRat(web3.toDecimal(market[11])).divide(bigRat(String(Math.pow(10, decimals)))).valueOf();
+
+                            // console.log(id, name, address, decimals, precision, minimum, lastPrice, owner, block);
+
+                            web3.eth.stateAt(address, user.addresses[0]).then(function (hexbalance) {
+                                // Wallet balance in the same units as available and trading
+                                var balance = 0;
+                                if (hexbalance && hexbalance != "0x")
+                                    balance = bigRat(web3.toDecimal(hexbalance)).divide(bigRat(String(Math.pow(10, decimals)))).valueOf();
+
+                                resolve({
+                                    id: id,
+                                    name: name,
+                                    address: address,
+                                    decimals: decimals,
+                                    minimum: _.parseInt(minimum),
+                                    precision: _.parseInt(precision),
+                                    lastPrice: lastPrice,
+                                    owner: owner,
+                                    block: block,
+                                    total_trades: total_trades,
+                                    available: available,
+                                    trading: trading,
+                                    balance: balance,
                                 });
-                            }
-                            catch(e) {
-                                reject(e);
-                            }
-                        }, function(e) {
-                            reject("Contract error: " + String(e));
-                        });
+                            }, function(e) {
+                                reject("Unable to get market balance: " + String(e));
+                            });
+                        }
+                        catch(e) {
+                            reject(e);
+                        }
                     });
                     marketPromises.push(marketPromise);
                 }
@@ -132,6 +156,9 @@ var EthereumClient = function() {
             var calldata = "0x09" + web3.padDecimal(String(market.id), 64);
             // console.log("CALLDATA", calldata);
 
+            // Block the book snapshot is taken at, sync from there afterwards
+            var snapshotBlock = web3.eth.number;
+
             // Set defaultBlock to 0 to get pending trade IDs
             web3.eth.defaultBlock = 0;
 
@@ -148,8 +175,13 @@ var EthereumClient = function() {
                 };
                 // console.log("TRADE IDS", trade_ids);
 
+                // Empty book
                 if (!trade_ids || trade_ids.length == 0) {
-                    failure("No trades found");
+                    snapshotBlock.then(function (block) {
+                        success([], _.parseInt(block));
+                    }, function(e) {
+                        failure("Unable to get block number: " + String(e));
+                    });
                     return;
                 }
 
@@ -176,60 +208,30 @@ var EthereumClient = function() {
                                     else
                                         minedStatus = 'mined';
 
-                                    // console.log("Trade from ABI:", trade);
-
-                                    var id = trade[0];
-
-                                    // Resolve on filled trades
-                                    if (id == "0x" + web3.padDecimal("0", 64))
-                                        resolve({});
-
-                                    var type = _.parseInt(trade[1]);
-                                    var marketid = _.parseInt(trade[2]);
-                                    var amountPrecision = Math.pow(10, market.decimals);
-                                    var precision = market.precision;
-
-                                    // console.log("Loading trade " + id + " for market " + market.name);
-
-                                    var amount = bigRat(trade[3]).divide(amountPrecision).valueOf();
-                                    var price = bigRat(trade[4]).divide(precision).valueOf();
-
                                     // Update progress
                                     progress({percent: (p + 1) / total * 100 });
 
-                                    resolve({
-                                        id: trade[0],
-                                        type: type == 1 ? 'buys' : 'sells',
-                                        price: price,
-                                        amount: amount,
-                                        total: amount * price,
-                                        owner: trade[5].replace("0x000000000000000000000000", "0x"),
-                                        market: {
-                                            id: market.id,
-                                            name: market.name
-                                        },
-                                        status: minedStatus,
-                                        block: _.parseInt(trade[6])
-                                    });
-                                });
+                                    resolve(this.parseTrade(trade, market, minedStatus));
+                                }.bind(this));
                             }
                             catch(e) {
                                 reject(e);
                             }
-                        }, function(e) {
+                        }.bind(this), function(e) {
                             reject("Contract error: " + String(e));
                         });
-                    });
+                    }.bind(this));
                     tradePromises.push(tradePromise);
                 }
 
-                Promise.all(tradePromises).then(function (trades) {
-                    success(trades);
+                Promise.all(tradePromises.concat([snapshotBlock])).then(function (trades) {
+                    var block = trades.pop();
+                    success(trades, _.parseInt(block));
                 }, function(e) {
                     failure("Could not load all trades: " + String(e));
                 });
 
-            }, function(e) {
+            }.bind(this), function(e) {
                 failure("There seems to be a contract there, but no market was found: " + String(e));
             });
         }
@@ -238,6 +240,77 @@ var EthereumClient = function() {
         };
     };
 
+    this.syncTrades = function(market, since, success, failure) {
+        try {
+            web3.eth.number.then(function (block) {
+                block = _.parseInt(block);
+
+                if (block <= since) {
+                    success({block: since, trades: [], removed: []});
+                    return;
+                }
+
+                // Book changes of this market since the last synced block
+                web3.eth.logs({
+                    earliest: since + 1,
+                    latest: block,
+                    address: fixtures.addresses.etherex,
+                    topics: "0x" + web3.padHex(market.id.toString(16), 64)
+                }).then(function (booklogs) {
+                    // Keep the latest remaining amount of each trade, logs come newest first
+                    var amounts = {};
+                    for (var i = booklogs.length - 1; i >= 0; i--) {
+                        if (booklogs[i].topics.length != 2)
+                            continue;
+                        var id = "0x" + web3.padHex(booklogs[i].topics[1], 64);
+                        amounts[id] = web3.toDecimal(booklogs[i].data);
+                    };
+
+                    var removed = [];
+                    var tradePromises = [];
+
+                    _.forEach(amounts, function(amount, id) {
+                        if (amount == "0") {
+                            removed.push(id);
+                            return;
+                        }
+
+                        // Only read the trades that changed
+                        tradePromises.push(new Promise(function (resolve, reject) {
+                            contract.get_trade(id).call().then(function (trade) {
+                                try {
+                                    resolve(this.parseTrade(trade, market, 'mined'));
+                                }
+                                catch(e) {
+                                    reject(e);
+                                }
+                            }.bind(this), function(e) {
+                                reject("Contract error: " + String(e));
+                            });
+                        }.bind(this)));
+                    }, this);
+
+                    Promise.all(tradePromises).then(function (trades) {
+                        success({
+                            block: block,
+                            trades: _.filter(trades, 'id'),
+                            removed: removed
+                        });
+                    }, function(e) {
+                        failure("Could not sync trades: " + String(e));
+                    });
+                }.bind(this), function(e) {
+                    failure("Could not get book changes: " + String(e));
+                });
+            }.bind(this), function(e) {
+                failure("Unable to get block number: " + String(e));
+            });
+        }
+        catch (e) {
+            failure("Unable to sync trades: " + String(e));
+        }
+    };
+
     this.loadPrices = function(market, success, failure) {
         var prices = [];
 
@@ -686,6 +759,38 @@ var EthereumClient = function() {
 
     // Utilities
 
+    this.parseTrade = function(trade, market, status) {
+        // console.log("Trade from ABI:", trade);
+
+        // Resolve on filled trades
+        if (trade[0] == "0x" + web3.padDecimal("0", 64))
+            return {};
+
+        var type = _.parseInt(trade[1]);
+        var amountPrecision = Math.pow(10, market.decimals);
+        var precision = market.precision;
+
+        // console.log("Loading trade " + trade[0] + " for market " + market.name);
+
+        var amount = bigRat(trade[3]).divide(amountPrecision).valueOf();
+        var price = bigRat(trade[4]).divide(precision).valueOf();
+
+        return {
+            id: trade[0],
+            type: type == 1 ? 'buys' : 'sells',
+            price: price,
+            amount: amount,
+            total: amount * price,
+            owner: trade[5].replace("0x000000000000000000000000", "0x"),
+            market: {
+                id: market.id,
+                name: market.name
+            },
+            status: status,
+            block: _.parseInt(trade[6])
+        };
+    };
+
     this.getAmounts = function(amount, price, decimals, precision) {
         var bigamount = bigRat(amount).multiply(bigRat(Math.pow(10, decimals))).floor(true).toString();
         var bigprice = bigRat(price).multiply(bigRat(precision)).floor(true).toString();
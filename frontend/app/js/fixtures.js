@@ -12,6 +12,7 @@ var fixtures = {
     },
     trade_fields: 7,
     market_fields: 9,
+    summary_fields: 12,
     contract_desc: [
         {
             "name": "price",
@@ -311,6 +312,65 @@ var fixtures = {
                     "type": "uint256"
                 }
             ]
+        },
+        {
+            "name": "change_ownership",
+            "inputs": [
+                {
+                    "name": "new_owner",
+                    "type": "hash256"
+                }
+            ],
+            "outputs": [
+                {
+                    "name": "result",
+                    "type": "uint256"
+                }
+            ]
+        },
+        {
+            "name": "register",
+            "inputs": [
+                {
+                    "name": "namereg",
+                    "type": "hash256"
+                }
+            ],
+            "outputs": []
+        },
+        {
+            "name": "unregister",
+            "inputs": [
+                {
+                    "name": "namereg",
+                    "type": "hash256"
+                }
+            ],
+            "outputs": []
+        },
+        {
+            "name": "get_markets",
+            "inputs": [
+                {
+                    "name": "start",
+                    "type": "uint256"
+                },
+                {
+                    "name": "count",
+                    "type": "uint256"
+                }
+            ],
+            "outputs": []
+        },
+        {
+            "name": "get_user_summary",
+            "inputs": [
+                {
+                    "name": "address",
+                    "type": "hash256"
+                }
+            ],
+            "outputs": []
         }
     ],
     sub_contract_desc: [
@@ -0,0 +1,177 @@
+// One side of a market's order book, kept sorted best price first
+// (highest for buys, lowest for sells, oldest first at the same price).
+// Trades live in a treap ordered by price then arrival, with subtree
+// sizes, so adding, updating, removing or ranking a trade is O(log n)
+// and the whole side is only walked when it is rendered.
+var Node = function(trade, sequence) {
+    this.trade = trade;
+    this.price = trade.price;
+    this.sequence = sequence;
+    this.priority = Math.random();
+    this.size = 1;
+    this.left = null;
+    this.right = null;
+};
+
+var size = function(node) {
+    return node ? node.size : 0;
+};
+
+var resize = function(node) {
+    node.size = 1 + size(node.left) + size(node.right);
+    return node;
+};
+
+var OrderBook = function(descending) {
+    this.descending = descending;
+    this.root = null;
+    this.ids = {};
+    this.sequence = 0;
+    this.cache = null;
+};
+
+OrderBook.prototype = {
+    // Whether price / sequence ranks before node
+    before: function(price, sequence, node) {
+        if (price != node.price)
+            return this.descending ? price > node.price : price < node.price;
+        return sequence < node.sequence;
+    },
+
+    // Nodes up to price / sequence on the left, the ones after it on the right
+    split: function(node, price, sequence) {
+        if (!node)
+            return [null, null];
+
+        if (this.before(price, sequence, node)) {
+            var parts = this.split(node.left, price, sequence);
+            node.left = parts[1];
+            return [parts[0], resize(node)];
+        }
+
+        var parts = this.split(node.right, price, sequence);
+        node.right = parts[0];
+        return [resize(node), parts[1]];
+    },
+
+    // Every node of left ranks before every node of right
+    merge: function(left, right) {
+        if (!left || !right)
+            return left || right;
+
+        if (left.priority > right.priority) {
+            left.right = this.merge(left.right, right);
+            return resize(left);
+        }
+
+        right.left = this.merge(left, right.left);
+        return resize(right);
+    },
+
+    // Number of trades ranked before price / sequence
+    rank: function(price, sequence) {
+        var node = this.root;
+        var count = 0;
+
+        while (node) {
+            if (this.before(price, sequence, node) || (price == node.price && sequence == node.sequence))
+                node = node.left;
+            else {
+                count += size(node.left) + 1;
+                node = node.right;
+            }
+        }
+
+        return count;
+    },
+
+    // Index of the first trade ranked after price (or at price when before is set)
+    search: function(price, before) {
+        return this.rank(price, before ? -Infinity : Infinity);
+    },
+
+    indexOf: function(id) {
+        var node = this.ids[id];
+        return node ? this.rank(node.price, node.sequence) : -1;
+    },
+
+    get: function(id) {
+        var node = this.ids[id];
+        return node ? node.trade : undefined;
+    },
+
+    insert: function(trade) {
+        if (this.ids[trade.id])
+            this.remove(trade.id);
+
+        var node = new Node(trade, this.sequence++);
+        var parts = this.split(this.root, node.price, node.sequence);
+        this.root = this.merge(this.merge(parts[0], node), parts[1]);
+        this.ids[trade.id] = node;
+        this.cache = null;
+    },
+
+    remove: function(id) {
+        var node = this.ids[id];
+        if (!node)
+            return null;
+
+        // Cut out the single node between the previous sequence and its own
+        var parts = this.split(this.root, node.price, node.sequence - 1);
+        var rest = this.split(parts[1], node.price, node.sequence);
+        this.root = this.merge(parts[0], rest[1]);
+
+        delete this.ids[id];
+        this.cache = null;
+        return node.trade;
+    },
+
+    // Replace a trade in place if its price didn't change, insert it otherwise
+    update: function(trade) {
+        var node = this.ids[trade.id];
+
+        if (node && node.price == trade.price) {
+            node.trade = trade;
+            this.cache = null;
+        }
+        else
+            this.insert(trade);
+    },
+
+    reset: function(trades) {
+        this.root = null;
+        this.ids = {};
+        this.sequence = 0;
+        this.cache = null;
+
+        // Trades at equal prices keep their order
+        trades = trades || [];
+        for (var i = 0; i < trades.length; i++)
+            this.insert(trades[i]);
+    },
+
+    // Trades in book order, rebuilt only after a change
+    toArray: function() {
+        if (this.cache)
+            return this.cache;
+
+        var trades = [];
+        var stack = [];
+        var node = this.root;
+
+        while (node || stack.length) {
+            while (node) {
+                stack.push(node);
+                node = node.left;
+            }
+            node = stack.pop();
+            trades.push(node.trade);
+            node = node.right;
+        }
+
+        this.cache = trades;
+        return trades;
+    }
+};
+
+module.exports = OrderBook;
@@ -4,12 +4,15 @@ var bigRat = require("big-rational");
 var fixtures = require("../js/fixtures");
 var constants = require("../js/constants");
 var utils = require("../js/utils");
+var OrderBook = require("../js/orderbook");
 
 var TradeStore = Fluxxor.createStore({
 
     initialize: function(options) {
         this.title = "Trades";
         this.trades = options.trades || {};
+        this.books = {};
+        this.pending = [];
         this.loading = true;
         this.updating = false;
         this.error = null;
@@ -30,7 +33,7 @@ var TradeStore = Fluxxor.createStore({
             constants.trade.LOAD_TRADES_FAIL, this.onTradesFail,
             constants.trade.UPDATE_TRADES, this.onUpdateTrades,
             constants.trade.UPDATE_TRADES_PROGRESS, this.onLoadTradesProgress,
-            constants.trade.UPDATE_TRADES_SUCCESS, this.onLoadTradesSuccess,
+            constants.trade.UPDATE_TRADES_SUCCESS, this.onUpdateTradesSuccess,
             constants.trade.UPDATE_TRADES_FAIL, this.onTradesFail,
             constants.trade.ADD_TRADE, this.onAddTrade,
             constants.trade.ADD_TRADE_FAIL, this.onTradesFail,
@@ -77,19 +80,20 @@ var TradeStore = Fluxxor.createStore({
 
     onLoadTradesSuccess: function(payload) {
         // Split in buys/sells
-        var trades = _.groupBy(payload, 'type');
+        var trades = _.groupBy(payload.trades, 'type');
 
-        // Sort
-        this.trades.buys = _.sortBy(trades.buys, 'price').reverse();
-        this.trades.sells = _.sortBy(trades.sells, 'price');
+        // Sort once into the market's book
+        var book = {
+            block: payload.block,
+            buys: new OrderBook(true),
+            sells: new OrderBook(false)
+        };
+        book.buys.reset(trades.buys);
+        book.sells.reset(trades.sells);
+        this.books[payload.market.id] = book;
+        this.pending = [];
 
-        // Update trades state
-        this.trades.tradeBuys = this.trades.buys;
-        this.trades.tradeSells = this.trades.sells;
-
-        // Filter by market
-        var market = this.flux.store("MarketStore").getState().market;
-        this.filterMarket(market, this.trades);
+        this.updateBook(book);
 
         this.loading = false;
         this.updating = false;
@@ -98,26 +102,94 @@ var TradeStore = Fluxxor.createStore({
         this.emit(constants.CHANGE_EVENT);
     },
 
+    onUpdateTradesSuccess: function(payload) {
+        var book = this.books[payload.market.id];
+
+        if (book) {
+            // Filled or cancelled
+            for (var i = 0; i < payload.removed.length; i++) {
+                if (!book.buys.remove(payload.removed[i]))
+                    book.sells.remove(payload.removed[i]);
+            }
+
+            // New or partially filled
+            for (var i = 0; i < payload.trades.length; i++) {
+                var trade = payload.trades[i];
+                (trade.type == "buys") ? book.buys.update(trade) : book.sells.update(trade);
+
+                // Drop the matching trade we added locally until it got mined
+                var placeholder = _.find(this.pending, {
+                    type: trade.type,
+                    price: trade.price,
+                    amount: trade.amount
+                });
+                if (placeholder) {
+                    _.remove(this.pending, {'id': placeholder.id});
+                    book[placeholder.type].remove(placeholder.id);
+                }
+            }
+
+            // Drop placeholders that were rejected or changed before they could be
+            // matched, they are mined in the block after they were added at the latest
+            var stale = _.remove(this.pending, function(placeholder) {
+                return placeholder.market.id == payload.market.id && payload.block > placeholder.block + 1;
+            });
+            for (var i = 0; i < stale.length; i++)
+                book[stale[i].type].remove(stale[i].id);
+
+            book.block = payload.block;
+            this.updateBook(book);
+        }
+
+        this.loading = false;
+        this.updating = false;
+        this.percent = 100;
+        this.emit(constants.CHANGE_EVENT);
+    },
+
+    updateBook: function(book) {
+        // Update trades state
+        this.trades.tradeBuys = book.buys.toArray();
+        this.trades.tradeSells = book.sells.toArray();
+
+        // Filter by market
+        var market = this.flux.store("MarketStore").getState().market;
+        this.filterMarket(market, {buys: this.trades.tradeBuys, sells: this.trades.tradeSells});
+    },
+
+    getBook: function(market_id) {
+        return this.books[market_id];
+    },
+
     onAddTrade: function(payload) {
         var markets = this.flux.store("MarketStore").getState().markets;
         var user = this.flux.store("UserStore").getState().user;
 
+        // Form values are strings, mined trades have numbers
+        var price = parseFloat(payload.price);
+        var amount = parseFloat(payload.amount);
+
         var trade = {
             id: payload.id,
-            type: (payload.type == 1) ? 'buy' : 'sell',
-            price: payload.price,
-            amount: payload.amount,
-            total: payload.amount * payload.price,
+            type: (payload.type == 1) ? 'buys' : 'sells',
+            price: price,
+            amount: amount,
+            total: amount * price,
             market: markets[payload.market - 1],
             owner: user.id,
             status: payload.status
         };
 
-        // Add and re-sort... TODO improve that...
-        (payload.type == 1) ? this.trades.buys.push(trade) : this.trades.sells.push(trade);
-        (payload.type == 1) ?
-            this.trades.buys = _.sortBy(this.trades.buys, 'price').reverse() :
-            this.trades.sells = _.sortBy(this.trades.sells, 'price');
+        // Insert in place, until the mined trade replaces it
+        var book = this.books[payload.market];
+        if (book) {
+            trade.block = book.block;
+            book[trade.type].insert(trade);
+            this.pending.push(trade);
+            this.updateBook(book);
+        }
+        else
+            this.trades[trade.type].push(trade);
 
         this.emit(constants.CHANGE_EVENT);
     },
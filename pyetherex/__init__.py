@@ -0,0 +1,6 @@
+# pyetherex -- EtherEx Python tools
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
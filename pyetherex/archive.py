@@ -0,0 +1,360 @@
+# archive.py -- EtherEx columnar tick archive
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+#
+# Fills and order events are stored per market as one fixed-width binary
+# file per column, appended in block order:
+#
+#   <root>/<market_id>/block.col      uint64
+#   <root>/<market_id>/timestamp.col  uint64
+#   <root>/<market_id>/event.col      uint8   (ADD, FILL, CANCEL)
+#   <root>/<market_id>/type.col       uint8   (1 = buy, 2 = sell)
+#   <root>/<market_id>/price.col      uint64
+#   <root>/<market_id>/amount.col     uint64
+#   <root>/<market_id>/owner.col      20 bytes
+#
+# Everything is little-endian.  Readers memory-map the files, so slicing
+# and scanning never loads more than the pages actually touched.
+#
+
+import binascii
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Event types
+ADD = 1
+FILL = 2
+CANCEL = 3
+
+COLUMNS = [
+    ('block', '<Q', '<u8'),
+    ('timestamp', '<Q', '<u8'),
+    ('event', '<B', 'u1'),
+    ('type', '<B', 'u1'),
+    ('price', '<Q', '<u8'),
+    ('amount', '<Q', '<u8'),
+    ('owner', '20s', 'S20'),
+]
+COLUMN_NAMES = [name for name, _, _ in COLUMNS]
+
+MAX_UINT64 = 2 ** 64 - 1
+
+
+def _column_path(root, market_id, name):
+    return os.path.join(root, str(market_id), name + '.col')
+
+def _address(value):
+    # Topics and storage values come left-padded to 32 bytes
+    if value.startswith('0x'):
+        value = value[2:]
+    return value.lower().rjust(40, '0')[-40:]
+
+def _owner_bytes(owner):
+    if not owner:
+        return b'\x00' * 20
+    if isinstance(owner, bytes) and len(owner) == 20:
+        return owner
+    return binascii.unhexlify(_address(owner))
+
+
+class TickWriter(object):
+    """Append-only writer for a single market's columns."""
+
+    def __init__(self, root, market_id):
+        self.root = root
+        self.market_id = market_id
+
+        directory = os.path.join(root, str(market_id))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.files = {}
+        for name, fmt, _ in COLUMNS:
+            self.files[name] = open(_column_path(root, market_id, name), 'ab')
+
+        # Resume after the last complete row, ignoring a partially written tail
+        reader = TickReader(root, market_id)
+        self.count = len(reader)
+        if self.count:
+            last = reader[self.count - 1]
+            self.last_block = last['block']
+            self.last_timestamp = last['timestamp']
+        else:
+            self.last_block = 0
+            self.last_timestamp = 0
+        reader.close()
+
+        for name, fmt, _ in COLUMNS:
+            f = self.files[name]
+            f.truncate(self.count * struct.calcsize(fmt))
+            f.seek(0, os.SEEK_END)
+
+    def append(self, block, timestamp, event, type, price, amount, owner=None):
+        if block < self.last_block:
+            raise ValueError("Ticks must be appended in block order, got block %d after %d" % (block, self.last_block))
+        if timestamp < self.last_timestamp:
+            raise ValueError("Ticks must be appended in time order, got %d after %d" % (timestamp, self.last_timestamp))
+        if price > MAX_UINT64 or amount > MAX_UINT64:
+            raise ValueError("Price and amount must fit in 64 bits")
+
+        row = {
+            'block': block,
+            'timestamp': timestamp,
+            'event': event,
+            'type': type,
+            'price': price,
+            'amount': amount,
+            'owner': _owner_bytes(owner)
+        }
+        for name, fmt, _ in COLUMNS:
+            self.files[name].write(struct.pack(fmt, row[name]))
+
+        self.last_block = block
+        self.last_timestamp = timestamp
+        self.count += 1
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TickReader(object):
+    """Memory-mapped, read-only view of a single market's columns.
+
+    Only rows present when the reader is opened are visible. NumPy views
+    returned by ``column()`` must be released before ``close()``.
+    """
+
+    def __init__(self, root, market_id):
+        self.root = root
+        self.market_id = market_id
+        self.maps = {}
+        self._files = []
+
+        count = None
+        for name, fmt, _ in COLUMNS:
+            path = _column_path(root, market_id, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            rows = size // struct.calcsize(fmt)
+            count = rows if count is None else min(count, rows)
+
+            if size:
+                f = open(path, 'rb')
+                self._files.append(f)
+                self.maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.maps[name] = None
+
+        # Columns are written one after the other, keep complete rows only
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("Tick index out of range")
+        row = {}
+        for name, fmt, _ in COLUMNS:
+            row[name] = struct.unpack_from(fmt, self.maps[name], i * struct.calcsize(fmt))[0]
+        return row
+
+    def _value(self, name, i):
+        fmt = COLUMNS[COLUMN_NAMES.index(name)][1]
+        return struct.unpack_from(fmt, self.maps[name], i * struct.calcsize(fmt))[0]
+
+    def _bisect(self, name, value):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            v = self._value(name, mid)
+            if v < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def column(self, name, start=0, stop=None):
+        """Zero-copy NumPy view of rows ``start:stop`` of a column."""
+        if numpy is None:
+            raise ImportError("numpy is required for column views")
+        if stop is None:
+            stop = self.count
+        dtype = numpy.dtype(COLUMNS[COLUMN_NAMES.index(name)][2])
+        if self.maps[name] is None:
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.frombuffer(self.maps[name], dtype=dtype, count=self.count)[start:stop]
+
+    def columns(self, start=0, stop=None):
+        return dict((name, self.column(name, start, stop)) for name in COLUMN_NAMES)
+
+    def block_range(self, start, end):
+        """Row indexes ``(lo, hi)`` for blocks ``start <= block < end``."""
+        return self._bisect('block', start), self._bisect('block', end)
+
+    def time_range(self, start, end):
+        """Row indexes ``(lo, hi)`` for timestamps ``start <= timestamp < end``."""
+        return self._bisect('timestamp', start), self._bisect('timestamp', end)
+
+    def blocks(self, start, end):
+        return self.columns(*self.block_range(start, end))
+
+    def between(self, start, end):
+        return self.columns(*self.time_range(start, end))
+
+    def close(self):
+        for m in self.maps.values():
+            if m is not None:
+                m.close()
+        for f in self._files:
+            f.close()
+        self.maps = {}
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#
+# Exporter
+#
+def _to_int(value):
+    if not hasattr(value, 'startswith'):
+        return value
+    return int(value, 16) if value.startswith('0x') else int(value)
+
+def _log_order(logs):
+    logs = list(logs)
+    blocks = [_to_int(entry.get('blockNumber', entry.get('number', 0))) for entry in logs]
+    if blocks and blocks[0] > blocks[-1]:
+        logs.reverse()
+    return sorted(logs, key=lambda entry: (_to_int(entry.get('blockNumber', entry.get('number', 0))),
+                                           _to_int(entry.get('logIndex', 0))))
+
+def export_logs(root, logs, markets, trades=None):
+    """Append exchange logs to the archive.
+
+    ``logs`` are JSON-RPC log objects for the exchange address, oldest or
+    newest first (``eth_logs`` and the UI walk them newest first). They
+    are put in block order, by ``logIndex`` within a block when present.
+    ``markets`` maps subcurrency contract addresses (the first topic of
+    price logs) to market IDs.
+
+    Price logs become FILL ticks. Book logs (``<market ID> <trade ID>``
+    with the remaining amount as data) become ADD ticks the first time a
+    trade shows up and CANCEL ticks when it drops to 0 without a fill.
+    ``trades`` maps trade IDs to their ``type``, ``price`` and ``owner``, as
+    read with ``get_trade`` while the trade is on the book; it also gives
+    fills their owner. A fill takes the owner of the book log right after
+    it if both come from the same transaction, or, without
+    ``transactionHash``, if that trade's remaining amount dropped by the
+    filled amount. Book logs of trades missing from ``trades`` are skipped,
+    and fills without a book log (signed orders) are written without owner.
+    Book logs carry no timestamp, order events get the log's ``timestamp``
+    if present, else the market's last one.
+
+    Returns the number of ticks written per market ID.
+    """
+    markets = dict((_address(address), market_id) for address, market_id in markets.items())
+    market_ids = set(markets.values())
+    trades = dict((_to_int(trade_id), trade) for trade_id, trade in (trades or {}).items())
+    remaining = {}
+    writers = {}
+    written = {}
+
+    def append(market_id, block, timestamp, event, type, price, amount, owner=None):
+        if market_id not in writers:
+            writers[market_id] = TickWriter(root, market_id)
+            written[market_id] = 0
+        writer = writers[market_id]
+        if timestamp is None:
+            timestamp = writer.last_timestamp
+        writer.append(block, timestamp, event, type, price, amount, owner)
+        written[market_id] += 1
+
+    try:
+        fill = None
+        for entry in _log_order(logs):
+            topics = entry['topics']
+            block = _to_int(entry.get('blockNumber', entry.get('number', 0)))
+
+            # Price log, held until the book log of the same fill names the trade
+            if len(topics) == 4:
+                if fill:
+                    append(*fill)
+                address = _address(topics[0])
+                fill = None
+                if address in markets:
+                    fill = [markets[address], block, _to_int(entry['data']), FILL,
+                            _to_int(topics[1]), _to_int(topics[2]), _to_int(topics[3])]
+                    transaction = entry.get('transactionHash')
+                continue
+
+            if len(topics) != 2:
+                continue
+
+            market_id = _to_int(topics[0])
+            trade_id = _to_int(topics[1])
+            amount = _to_int(entry['data'])
+            trade = trades.get(trade_id)
+
+            if fill and fill[0] == market_id and fill[1] == block:
+                if transaction and entry.get('transactionHash'):
+                    paired = transaction == entry['transactionHash']
+                else:
+                    paired = trade_id in remaining and remaining[trade_id] - amount == fill[6]
+            else:
+                paired = False
+
+            if paired:
+                append(*(fill + [trade and trade['owner']]))
+                fill = None
+                remaining[trade_id] = amount
+                continue
+            if fill:
+                append(*fill)
+                fill = None
+
+            if market_id not in market_ids or trade is None:
+                continue
+
+            timestamp = _to_int(entry['timestamp']) if 'timestamp' in entry else None
+            if trade_id not in remaining:
+                if amount:
+                    append(market_id, block, timestamp, ADD, _to_int(trade['type']), _to_int(trade['price']), amount, trade['owner'])
+            elif not amount and remaining[trade_id]:
+                append(market_id, block, timestamp, CANCEL, _to_int(trade['type']), _to_int(trade['price']), remaining[trade_id], trade['owner'])
+            remaining[trade_id] = amount
+
+        if fill:
+            append(*fill)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return written
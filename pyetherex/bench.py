@@ -0,0 +1,226 @@
+# bench.py -- EtherEx benchmark instrumentation
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+#
+# A Profiler wraps the functions a test flow spends its time in and
+# charges each call to a phase (compile, deploy, send, mine, storage).
+# Only the outermost instrumented call is charged, so storage reads done
+# while executing a transaction count as send, and whatever is left of
+# the wall time is the test's own logic.
+#
+# Peak memory comes from tracemalloc when it has reset_peak (Python 3.9+):
+# the most Python allocated above what it held when the phase started.
+# Elsewhere, including the Python 2 pyethereum runs on, it falls back to
+# the process' maximum resident size: how much a phase raised it, and its
+# value once the flow is done. That is a lifetime high-water mark, so
+# run_forked runs each flow in a child process that starts from the
+# parent's current size. Results record which measure was used, and only
+# results measured the same way are compared.
+#
+
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+    if not hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc = None
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PHASES = ('compile', 'deploy', 'send', 'mine', 'storage')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+def maxrss():
+    """Maximum resident size of the process so far, in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Profiler(object):
+
+    def __init__(self, memory=True):
+        self.memory = None
+        if memory and tracemalloc is not None:
+            self.memory = 'tracemalloc'
+        elif memory and resource is not None:
+            self.memory = 'rusage'
+        self.patches = []
+        self.depth = 0
+        self.reset()
+
+    def reset(self):
+        self.phases = dict((phase, {'calls': 0, 'time': 0.0, 'peak': None})
+                           for phase in PHASES)
+        self.peak = None
+
+    def wrap(self, phase, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.depth:
+                return func(*args, **kwargs)
+
+            self.depth += 1
+            current = self._enter()
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = timer() - start
+                self.depth -= 1
+
+                stats = self.phases[phase]
+                stats['calls'] += 1
+                stats['time'] += elapsed
+                if self.memory:
+                    stats['peak'] = max(stats['peak'] or 0, self._exit(current))
+        return wrapper
+
+    def patch(self, owner, name, phase):
+        # Keep the raw attribute so restore puts back exactly what was there
+        original = vars(owner)[name]
+        self.patches.append((owner, name, original))
+        setattr(owner, name, self.wrap(phase, getattr(owner, name)))
+
+    def restore(self):
+        while self.patches:
+            owner, name, original = self.patches.pop()
+            setattr(owner, name, original)
+
+    def _enter(self):
+        if self.memory == 'rusage':
+            return maxrss()
+        if not self.memory:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak or 0, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def _exit(self, start):
+        if self.memory == 'rusage':
+            peak = maxrss()
+        else:
+            current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak or 0, peak)
+        return peak - start
+
+    def run(self, func):
+        """Run func once and return its wall time and per phase breakdown"""
+        self.reset()
+        if self.memory == 'tracemalloc':
+            tracemalloc.start()
+
+        start = timer()
+        try:
+            func()
+        finally:
+            wall = timer() - start
+            if self.memory == 'tracemalloc':
+                self.peak = max(self.peak or 0, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            elif self.memory == 'rusage':
+                self.peak = maxrss()
+
+        phases = dict((phase, dict(stats)) for phase, stats in self.phases.items())
+        return {
+            'wall': wall,
+            'memory': self.memory,
+            'peak': self.peak,
+            'phases': phases,
+            'other': max(wall - sum(stats['time'] for stats in phases.values()), 0.0)
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.restore()
+
+
+def run_forked(profiler, func):
+    """Run profiler.run(func) in a child process and return its result"""
+    read, write = os.pipe()
+    pid = os.fork()
+    if not pid:
+        status = 1
+        try:
+            os.close(read)
+            try:
+                output = {'result': profiler.run(func)}
+            except BaseException as e:
+                output = {'error': '%s: %s' % (type(e).__name__, e)}
+            with os.fdopen(write, 'w') as f:
+                json.dump(output, f)
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write)
+    with os.fdopen(read) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+
+    if not data:
+        raise RuntimeError("Benchmark process exited without a result")
+    output = json.loads(data)
+    if 'error' in output:
+        raise RuntimeError(output['error'])
+    return output['result']
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+def save_history(path, history):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+    os.rename(tmp, path)
+
+def append_history(path, run):
+    history = load_history(path)
+    history.append(run)
+    save_history(path, history)
+    return history
+
+def previous_flow(history, name):
+    """Latest recorded result for a flow, or None"""
+    for run in reversed(history):
+        if name in run.get('flows', {}):
+            return run['flows'][name]
+    return None
+
+def compare(before, after):
+    """Relative change of wall time, peak memory and phase times"""
+    def change(old, new):
+        if not old or new is None:
+            return None
+        return float(new - old) / old
+
+    same_memory = before.get('memory') == after.get('memory')
+    changes = {
+        'wall': change(before['wall'], after['wall']),
+        'peak': change(before.get('peak'), after.get('peak')) if same_memory else None,
+        'other': change(before.get('other'), after.get('other'))
+    }
+    for phase in PHASES:
+        old = before['phases'].get(phase, {}).get('time')
+        changes[phase] = change(old, after['phases'][phase]['time'])
+    return changes
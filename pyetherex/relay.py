@@ -0,0 +1,260 @@
+# relay.py -- EtherEx signed order relay
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+#
+# Makers sign orders off-chain and hand them to a relay, which keeps the
+# book and sends fills to the exchange's trade_signed. Placing an order
+# costs no gas and nothing but fills touches contract storage.
+#
+# An order is signed over
+#
+#   sha3([exchange, market_id, type, amount, price, expiry, nonce])
+#
+# 32 bytes per word, exactly like the contract hashes it. Raising the
+# maker's nonce on chain with cancel_signed cancels every order signed
+# with a lower one.
+#
+# The relay commits to its book with a Merkle root over the order hashes
+# in priority order, so makers can check their order is in the book with
+# a proof instead of trusting the relay.
+#
+
+import binascii
+import bisect
+import itertools
+
+try:
+    import bitcoin
+    from pyethereum import tester
+    from pyethereum import utils
+except ImportError:
+    bitcoin = tester = utils = None
+
+# ABI function IDs
+TRADE_SIGNED = 17
+CANCEL_SIGNED = 18
+GET_SIGNED_ORDER = 19
+DEPOSIT_ETH = 20
+WITHDRAW_ETH = 21
+
+BUY = 1
+SELL = 2
+
+ORDER_FIELDS = ('market', 'type', 'amount', 'price', 'expiry', 'nonce')
+
+
+def _word(value):
+    return binascii.unhexlify('%064x' % (value % 2 ** 256))
+
+def _address(value):
+    return value[2:] if value.startswith('0x') else value
+
+def _hex(data):
+    return binascii.hexlify(data).decode()
+
+def order_hash(exchange, market_id, type, amount, price, expiry, nonce):
+    words = [int(_address(exchange), 16), market_id, type, amount, price, expiry, nonce]
+    return utils.sha3(b''.join(_word(word) for word in words))
+
+def sign_order(key, exchange, market_id, type, amount, price, expiry, nonce):
+    """Sign an order with a private key, returning the order to relay"""
+    msghash = order_hash(exchange, market_id, type, amount, price, expiry, nonce)
+    v, r, s = bitcoin.ecdsa_raw_sign(msghash, key)
+    return {
+        'exchange': _address(exchange),
+        'market': market_id,
+        'type': type,
+        'amount': amount,
+        'price': price,
+        'expiry': expiry,
+        'nonce': nonce,
+        'v': v,
+        'r': r,
+        's': s,
+        'maker': utils.privtoaddr(key),
+        'hash': _hex(msghash)
+    }
+
+def recover(order):
+    """Address that signed an order, as the contract's ecrecover sees it"""
+    msghash = order_hash(order['exchange'], *[order[field] for field in ORDER_FIELDS])
+    pubkey = bitcoin.ecdsa_raw_recover(msghash, (order['v'], order['r'], order['s']))
+    if not pubkey:
+        return None
+    return _hex(utils.sha3(bitcoin.encode_pubkey(pubkey, 'bin')[1:])[12:])
+
+#
+# Merkle commitments, odd nodes are carried up a level unchanged
+#
+def _parent(left, right):
+    return utils.sha3(left + right)
+
+def merkle_root(leaves):
+    if not leaves:
+        return b'\x00' * 32
+
+    level = list(leaves)
+    while len(level) > 1:
+        level = [_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+def merkle_proof(leaves, index):
+    """Sibling hashes from a leaf up to the root, None where a node is carried"""
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        proof.append(level[sibling] if sibling < len(level) else None)
+        level = [_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        index //= 2
+    return proof
+
+def verify_proof(leaf, index, proof, root):
+    node = leaf
+    for sibling in proof:
+        if sibling is not None:
+            node = _parent(sibling, node) if index & 1 else _parent(node, sibling)
+        index //= 2
+    return node == root
+
+
+class RelayError(Exception):
+    pass
+
+
+class Relay(object):
+    """Order book of signed orders, settled on a ``pyethereum.tester`` chain"""
+
+    def __init__(self, state, exchange, key=None):
+        self.state = state
+        self.exchange = _address(exchange)
+        self.key = key or tester.k0
+        self.orders = {}
+        self.books = {}
+        self.makers = {}
+        self.sequence = itertools.count()
+
+    def _send(self, key, funid, abi, value=0):
+        return [x % 2 ** 256 for x in self.state.send(key, self.exchange, value, funid=funid, abi=abi)]
+
+    def _call(self, funid, abi):
+        snapshot = self.state.snapshot()
+        try:
+            return self._send(self.key, funid, abi)
+        finally:
+            self.state.revert(snapshot)
+
+    def status(self, order):
+        """Filled amount, maker nonce and maker ETH balance on chain"""
+        filled, nonce, balance = self._call(GET_SIGNED_ORDER, [int(order['maker'], 16), int(order['hash'], 16)])
+        return {'filled': filled, 'nonce': nonce, 'balance': balance}
+
+    def _check(self, order):
+        if order['expiry'] < self.state.block.number:
+            return "Order expired"
+
+        status = self.status(order)
+        order['filled'] = status['filled']
+        if order['nonce'] < status['nonce']:
+            return "Order cancelled"
+        if order['filled'] >= order['amount']:
+            return "Order filled"
+        return None
+
+    def submit(self, order):
+        """Verify a signed order and add it to the book, returning its hash"""
+        if _address(order['exchange']) != self.exchange:
+            raise RelayError("Order signed for another exchange")
+        if order['type'] not in (BUY, SELL):
+            raise RelayError("Invalid order type")
+
+        order = dict(order)
+        order['hash'] = _hex(order_hash(self.exchange, *[order[field] for field in ORDER_FIELDS]))
+        maker = recover(order)
+        if not maker or maker != _address(order.get('maker', maker)):
+            raise RelayError("Invalid signature")
+        order['maker'] = maker
+
+        if order['hash'] in self.orders:
+            raise RelayError("Order already exists")
+        error = self._check(order)
+        if error:
+            raise RelayError(error)
+
+        # Best price first, then first come first served
+        price = -order['price'] if order['type'] == BUY else order['price']
+        order['key'] = (price, next(self.sequence))
+        bisect.insort(self.books.setdefault((order['market'], order['type']), []), (order['key'], order['hash']))
+        self.orders[order['hash']] = order
+        self.makers.setdefault(maker, set()).add(order['hash'])
+
+        return order['hash']
+
+    def remove(self, order_hash):
+        order = self.orders.pop(order_hash)
+        book = self.books[(order['market'], order['type'])]
+        del book[bisect.bisect_left(book, (order['key'], order_hash))]
+        self.makers[order['maker']].discard(order_hash)
+        return order
+
+    def book(self, market_id, type):
+        return [self.orders[order_hash] for _, order_hash in self.books.get((market_id, type), [])]
+
+    def best(self, market_id, type):
+        book = self.books.get((market_id, type))
+        return self.orders[book[0][1]] if book else None
+
+    def sync(self, order_hashes=None):
+        """Drop expired, cancelled and filled orders, returning their hashes
+
+        Only the given orders are checked if any, each check is a call to
+        the chain.
+        """
+        if order_hashes is None:
+            order_hashes = list(self.orders)
+        dropped = [order_hash for order_hash in order_hashes
+                   if order_hash in self.orders and self._check(self.orders[order_hash])]
+        for order_hash in dropped:
+            self.remove(order_hash)
+        return dropped
+
+    def fill(self, key, order_hash, max_amount, value=0):
+        """Settle up to max_amount of an order on chain for the taker's key"""
+        order = self.orders[order_hash]
+        abi = [order[field] for field in ORDER_FIELDS]
+        abi += [order['v'], order['r'], order['s'], max_amount]
+
+        result = self._send(key, TRADE_SIGNED, abi, value)[0]
+        self.sync([order_hash])
+        return result
+
+    def cancel(self, key, nonce):
+        """Cancel all orders of the key's maker signed with a lower nonce"""
+        result = self._send(key, CANCEL_SIGNED, [nonce])[0]
+
+        # One read of the maker's nonce covers all of the maker's orders
+        maker = utils.privtoaddr(key)
+        nonce = self.status({'maker': maker, 'hash': '00'})['nonce']
+        for order_hash in list(self.makers.get(maker, ())):
+            if self.orders[order_hash]['nonce'] < nonce:
+                self.remove(order_hash)
+
+        return result
+
+    def root(self, market_id):
+        return merkle_root(self.leaves(market_id))
+
+    def leaves(self, market_id):
+        return [binascii.unhexlify(order['hash']) for type in (BUY, SELL) for order in self.book(market_id, type)]
+
+    def proof(self, order_hash):
+        """Index and Merkle proof of an order in its market's book"""
+        leaves = self.leaves(self.orders[order_hash]['market'])
+        index = leaves.index(binascii.unhexlify(order_hash))
+        return index, merkle_proof(leaves, index)
@@ -0,0 +1,400 @@
+# rpc.py -- EtherEx JSON-RPC client
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+#
+# Every call returns a Future right away. A fixed pool of worker threads,
+# each holding its own keep-alive HTTP connection, drains the queue of
+# pending calls and merges whatever is waiting into a single JSON-RPC
+# batch request, so issuing many reads before resolving any of them costs
+# a handful of round trips instead of one per read.
+#
+# Transactions skip the pool and go through a single worker of their own,
+# which assigns nonces as it sends them, so a sender's transactions always
+# reach the node in nonce order.
+#
+
+import itertools
+import json
+import threading
+import time
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+
+class RPCError(Exception):
+    def __init__(self, code, message):
+        super(RPCError, self).__init__("%s (code %s)" % (message, code))
+        self.code = code
+        self.message = message
+
+
+class Future(object):
+    """Result of a pending call, optionally post-processed by ``transform``."""
+
+    def __init__(self, transform=None):
+        self._transform = transform
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_result(self, result):
+        if self._transform is not None:
+            try:
+                result = self._transform(result)
+            except Exception as e:
+                self.set_exception(e)
+                return
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+    def add_done_callback(self, fn):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def done(self):
+        return self._event.is_set()
+
+    def exception(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise RPCError(-1, "Timed out waiting for response")
+        return self._exception
+
+    def result(self, timeout=None):
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+
+#
+# Serpent ABI
+#
+def encode_call(funid, args):
+    data = "%02x" % funid
+    for arg in args:
+        if hasattr(arg, 'startswith'):
+            arg = int(arg, 16)
+        data += "%064x" % (arg % 2 ** 256)
+    return "0x" + data
+
+def decode_words(data):
+    if data.startswith('0x'):
+        data = data[2:]
+    return [int(data[i:i + 64], 16) for i in range(0, len(data), 64)]
+
+def to_int(value):
+    if not value or value == "0x":
+        return 0
+    return int(value, 16)
+
+
+class RPCClient(object):
+    """Batching JSON-RPC client.
+
+    ``pool_size`` is the number of keep-alive connections (and worker
+    threads) for calls, transactions get one more of their own.
+    ``max_batch`` is the most calls merged into one HTTP request and
+    ``max_in_flight`` the most calls queued or awaiting a response; further
+    calls block until earlier ones complete. ``batch_delay`` is how long a
+    worker waits for more calls to join a batch that is not yet full.
+    """
+
+    def __init__(self, url="http://localhost:8080", pool_size=4, max_batch=32, max_in_flight=256, batch_delay=0.001, timeout=30):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path or "/"
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+
+        self._pending = queue.Queue()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._ids = itertools.count(1)
+        self._ids_lock = threading.Lock()
+
+        # Only used by the transaction worker
+        self._transactions = queue.Queue()
+        self._nonces = {}
+
+        self._workers = []
+        for i in range(pool_size):
+            self._start(self._pending, False)
+        self._start(self._transactions, True)
+
+    def _start(self, pending, transactions):
+        worker = threading.Thread(target=self._work, args=(pending, transactions))
+        worker.daemon = True
+        worker.start()
+        self._workers.append((worker, pending))
+
+    def close(self):
+        for worker, pending in self._workers:
+            pending.put(None)
+        for worker, pending in self._workers:
+            worker.join()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #
+    # Transport
+    #
+    def call_async(self, method, params=None, transform=None):
+        return self._enqueue(self._pending, method, params, transform)
+
+    def _enqueue(self, pending, method, params=None, transform=None):
+        if not self._workers:
+            raise RPCError(-1, "Client is closed")
+        self._in_flight.acquire()
+        with self._ids_lock:
+            id = next(self._ids)
+        future = Future(transform)
+        request = {"jsonrpc": "2.0", "id": id, "method": method, "params": params or []}
+        pending.put((request, future))
+        return future
+
+    def call(self, method, params=None):
+        return self.call_async(method, params).result(self.timeout)
+
+    def _connect(self):
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _work(self, pending, transactions):
+        connection = self._connect()
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                batch = [item]
+
+                # Merge whatever else is waiting, up to max_batch
+                deadline = time.time() + self.batch_delay
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.time()
+                    try:
+                        if remaining > 0:
+                            item = pending.get(True, remaining)
+                        else:
+                            item = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        # Put the shutdown marker back once this batch is sent
+                        pending.put(None)
+                        break
+                    batch.append(item)
+
+                if transactions:
+                    connection, batch = self._assign_nonces(connection, batch)
+                connection = self._send(connection, batch)
+                if transactions:
+                    self._check_nonces(batch)
+        finally:
+            connection.close()
+
+    def _post(self, connection, body):
+        connection.request("POST", self.path, body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise RPCError(response.status, "HTTP error: %s" % response.reason)
+        return json.loads(data.decode('utf-8'))
+
+    def _request(self, connection, body):
+        try:
+            return connection, self._post(connection, body)
+        except (httplib.HTTPException, IOError):
+            # Stale keep-alive connection, retry once on a fresh one
+            connection.close()
+            connection = self._connect()
+            return connection, self._post(connection, body)
+
+    def _send(self, connection, batch):
+        if not batch:
+            return connection
+
+        body = json.dumps([request for request, _ in batch])
+        futures = dict((request["id"], future) for request, future in batch)
+
+        try:
+            connection, responses = self._request(connection, body)
+        except Exception as e:
+            for future in futures.values():
+                self._in_flight.release()
+                future.set_exception(e)
+            return connection
+
+        if isinstance(responses, dict):
+            responses = [responses]
+
+        for response in responses:
+            future = futures.pop(response.get("id"), None)
+            if future is None:
+                continue
+            self._in_flight.release()
+            if response.get("error"):
+                error = response["error"]
+                future.set_exception(RPCError(error.get("code"), error.get("message")))
+            else:
+                future.set_result(response.get("result"))
+
+        for future in futures.values():
+            self._in_flight.release()
+            future.set_exception(RPCError(-1, "Missing response"))
+
+        return connection
+
+    #
+    # Ethereum
+    #
+    def balance_at(self, address):
+        return self.call_async("eth_balanceAt", [address], to_int)
+
+    def state_at(self, address, key):
+        return self.call_async("eth_stateAt", [address, key], to_int)
+
+    def count_at(self, address):
+        return self.call_async("eth_countAt", [address], to_int)
+
+    def contract_call(self, address, funid, args=None):
+        return self.call_async("eth_call", [{"to": address, "data": encode_call(funid, args or [])}], decode_words)
+
+    #
+    # Transactions
+    #
+    def _assign_nonces(self, connection, batch):
+        # Runs on the transaction worker, the only one touching _nonces
+        ready = []
+        for request, future in batch:
+            transaction = request["params"][0]
+            sender = transaction["from"]
+
+            if sender not in self._nonces:
+                body = json.dumps({"jsonrpc": "2.0", "id": 0, "method": "eth_countAt", "params": [sender]})
+                try:
+                    connection, response = self._request(connection, body)
+                    if response.get("error"):
+                        raise RPCError(response["error"].get("code"), response["error"].get("message"))
+                    self._nonces[sender] = to_int(response.get("result"))
+                except Exception as e:
+                    self._in_flight.release()
+                    future.set_exception(e)
+                    continue
+
+            transaction["nonce"] = hex(self._nonces[sender]).rstrip('L')
+            self._nonces[sender] += 1
+            ready.append((request, future))
+
+        return connection, ready
+
+    def _check_nonces(self, batch):
+        # Resynchronize with the node after a failed submission
+        for request, future in batch:
+            if future.exception(0) is not None:
+                self._nonces.pop(request["params"][0]["from"], None)
+
+    def transact(self, sender, to, value=0, funid=None, args=None, gas=10000, gas_price=10 ** 12):
+        """Submit a transaction without waiting for earlier ones to complete.
+
+        Nonces are assigned locally so several transactions from the same
+        sender can be in flight at once. A failed submission drops the
+        local nonce so the next one resynchronizes with the node.
+        """
+        transaction = {
+            "from": sender,
+            "to": to,
+            "value": hex(value).rstrip('L'),
+            "gas": hex(gas).rstrip('L'),
+            "gasPrice": hex(gas_price).rstrip('L')
+        }
+        if funid is not None:
+            transaction["data"] = encode_call(funid, args or [])
+
+        return self._enqueue(self._transactions, "eth_transact", [transaction])
+
+
+#
+# EtherEx
+#
+GET_MARKET = 8
+GET_TRADE_IDS = 9
+GET_TRADE = 10
+GET_SUB_BALANCE = 11
+GET_MARKETS = 15
+GET_USER_SUMMARY = 16
+GET_SIGNED_ORDER = 19
+
+class ExchangeClient(object):
+    """Read helpers for the exchange contract, each returning a Future."""
+
+    def __init__(self, rpc, address):
+        self.rpc = rpc
+        self.address = address
+
+    def last_market(self):
+        return self.rpc.state_at(self.address, "0x5")
+
+    def get_market(self, market_id):
+        return self.rpc.contract_call(self.address, GET_MARKET, [market_id])
+
+    def get_trade_ids(self, market_id):
+        return self.rpc.contract_call(self.address, GET_TRADE_IDS, [market_id])
+
+    def get_trade(self, trade_id):
+        return self.rpc.contract_call(self.address, GET_TRADE, [trade_id])
+
+    def get_sub_balance(self, address, market_id):
+        return self.rpc.contract_call(self.address, GET_SUB_BALANCE, [address, market_id])
+
+    def get_markets(self, start, count):
+        return self.rpc.contract_call(self.address, GET_MARKETS, [start, count])
+
+    def get_user_summary(self, address):
+        return self.rpc.contract_call(self.address, GET_USER_SUMMARY, [address])
+
+    def get_signed_order(self, maker, order_hash):
+        return self.rpc.contract_call(self.address, GET_SIGNED_ORDER, [maker, order_hash])
+
+    def get_trades(self, trade_ids):
+        """Fetch several trades, batched into as few requests as possible."""
+        futures = [self.get_trade(trade_id) for trade_id in trade_ids]
+        return [future.result(self.rpc.timeout) for future in futures]
@@ -0,0 +1,161 @@
+# server.py -- Local JSON-RPC stand-in for testing
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+#
+# Serves the subset of the node's JSON-RPC API used by the exchange
+# clients, backed by a pyethereum tester state. Batch requests are
+# answered in order, so pipelined transactions are applied in the order
+# they were submitted.
+#
+
+import json
+import threading
+
+try:
+    import BaseHTTPServer
+    import SocketServer as socketserver
+except ImportError:
+    import http.server as BaseHTTPServer
+    import socketserver
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length).decode('utf-8'))
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.batches.append(len(payload) if isinstance(payload, list) else 1)
+
+        if isinstance(payload, list):
+            result = [self.server.handle(request) for request in payload]
+        else:
+            result = self.server.handle(payload)
+
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RPCServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """JSON-RPC server dispatching ``method(*params)`` to ``methods``.
+
+    ``requests`` counts HTTP requests and ``batches`` records the size of
+    each one, so tests can check how calls were merged.
+    """
+    daemon_threads = True
+
+    def __init__(self, methods, host="127.0.0.1", port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+        self.methods = methods
+        self.requests = 0
+        self.batches = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.server_address
+
+    def handle(self, request):
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        method = self.methods.get(request.get("method"))
+        if method is None:
+            response["error"] = {"code": -32601, "message": "Method not found"}
+            return response
+        try:
+            with self.lock:
+                response["result"] = method(*request.get("params", []))
+        except Exception as e:
+            response["error"] = {"code": -32000, "message": str(e)}
+        return response
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+#
+# pyethereum tester backend
+#
+def _hex(x):
+    return "0x%x" % x
+
+def _words(values):
+    return "0x" + "".join("%064x" % (v % 2 ** 256) for v in values)
+
+def _address(value):
+    return value[2:] if value.startswith("0x") else value
+
+def _abi(transaction):
+    # Serpent ABI call data: one byte function ID, then 32 byte arguments
+    data = _address(transaction.get("data") or "0x")
+    if not data:
+        return {"data": []}
+    return {
+        "funid": int(data[:2], 16),
+        "abi": [int(data[i:i + 64], 16) for i in range(2, len(data), 64)]
+    }
+
+def tester_methods(state):
+    """JSON-RPC methods backed by a ``pyethereum.tester`` state.
+
+    Transactions are signed with the tester key matching ``from``.
+    """
+    from pyethereum import tester
+    from pyethereum.utils import sha3
+
+    keys = dict(zip(tester.accounts, tester.keys))
+
+    def balance_at(address):
+        return _hex(state.block.get_balance(_address(address)))
+
+    def state_at(address, key):
+        return _hex(state.block.get_storage_data(_address(address), int(key, 16)))
+
+    def count_at(address):
+        return _hex(state.block.get_nonce(_address(address)))
+
+    def call(transaction):
+        sender = _address(transaction.get("from", tester.a0))
+        snapshot = state.snapshot()
+        try:
+            result = state.send(keys[sender], _address(transaction["to"]), 0, **_abi(transaction))
+        finally:
+            state.revert(snapshot)
+        return _words(result)
+
+    def transact(transaction):
+        sender = _address(transaction["from"])
+        nonce = state.block.get_nonce(sender)
+        if "nonce" in transaction and int(transaction["nonce"], 16) != nonce:
+            raise ValueError("Invalid nonce, expected %d" % nonce)
+        state.send(keys[sender], _address(transaction["to"]), int(transaction.get("value", "0x0"), 16), **_abi(transaction))
+        return "0x" + sha3(sender + str(nonce)).encode('hex')
+
+    return {
+        "eth_balanceAt": balance_at,
+        "eth_stateAt": state_at,
+        "eth_countAt": count_at,
+        "eth_call": call,
+        "eth_transact": transact
+    }
@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+# runbenchmarks.py -- EtherEx benchmarks launcher
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+#
+# Runs TestEtherEx flows under the pyetherex.bench profiler and appends
+# the results to a JSON history, so harness changes can be compared
+# against previous runs:
+#
+#   python runbenchmarks.py                      # default flows
+#   python runbenchmarks.py test_cancel_trade -n 5
+#
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import platform
+import subprocess
+import sys
+sys.path.insert(0, './serpent')
+sys.path.insert(0, './tests')
+
+import serpent
+from pyethereum import blocks
+from pyethereum import tester
+
+from pyetherex import bench
+from etherex import TestEtherEx
+
+FLOWS = [
+    'test_creation',
+    'test_initialize',
+    'test_deposit_to_exchange',
+    'test_add_buy_trades',
+    'test_add_sell_trades',
+    'test_cancel_trade',
+    'test_fulfill_first_buy',
+    'test_fulfill_multiple_trades',
+    'test_buy_partial_fills_leave_no_dust',
+]
+
+HISTORY = 'benchmarks.json'
+
+
+def install(profiler):
+    profiler.patch(serpent, 'compile', 'compile')
+    profiler.patch(tester.state, 'evm', 'deploy')
+    profiler.patch(tester.state, 'send', 'send')
+    profiler.patch(tester.state, 'mine', 'mine')
+    profiler.patch(blocks.Block, 'account_to_dict', 'storage')
+    profiler.patch(blocks.Block, 'get_storage_data', 'storage')
+
+def run_flow(profiler, name, repeat):
+    def flow():
+        test = TestEtherEx()
+        method = getattr(test, name)
+        test.setup_method(method)
+        method()
+
+    # Maximum resident size never goes down, each run gets its own process
+    if profiler.memory == 'rusage':
+        results = [bench.run_forked(profiler, flow) for _ in range(repeat)]
+    else:
+        results = [profiler.run(flow) for _ in range(repeat)]
+
+    # Keep the fastest run, the others only add scheduling noise, but
+    # memory from the first one, later runs reuse what it allocated
+    result = min(results, key=lambda result: result['wall'])
+    cold = results[0]
+    return dict(result,
+                peak=cold['peak'],
+                phases=dict((phase, dict(stats, peak=cold['phases'][phase]['peak']))
+                            for phase, stats in result['phases'].items()))
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD']).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percent(value):
+    return '' if value is None else '%+.1f%%' % (value * 100)
+
+def report(name, result, previous):
+    changes = bench.compare(previous, result) if previous else {}
+
+    print(name)
+    print('  %-8s %9.3fs %8s' % ('wall', result['wall'], percent(changes.get('wall'))))
+    for phase in bench.PHASES:
+        stats = result['phases'][phase]
+        peak = '' if stats['peak'] is None else '%8.1f KiB' % (stats['peak'] / 1024.0)
+        print('  %-8s %9.3fs %8s %6d calls %s' % (
+            phase, stats['time'], percent(changes.get(phase)), stats['calls'], peak))
+    print('  %-8s %9.3fs %8s' % ('other', result['other'], percent(changes.get('other'))))
+    if result['peak'] is not None:
+        print('  %-8s %8.1f KiB %8s' % ('peak', result['peak'] / 1024.0, percent(changes.get('peak'))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EtherEx test flows")
+    parser.add_argument('flows', nargs='*', default=FLOWS,
+                        help="TestEtherEx methods to run")
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help="runs per flow, the fastest is kept")
+    parser.add_argument('-o', '--output', default=HISTORY,
+                        help="JSON history file")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip memory measurement, tracemalloc slows every allocation down")
+    parser.add_argument('--no-save', action='store_true',
+                        help="don't append the results to the history")
+    args = parser.parse_args()
+
+    history = bench.load_history(args.output)
+    run = {
+        'date': datetime.datetime.utcnow().isoformat() + 'Z',
+        'revision': revision(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'memory': None,
+        'flows': {}
+    }
+
+    with bench.Profiler(memory=not args.no_memory) as profiler:
+        install(profiler)
+        run['memory'] = profiler.memory
+
+        for name in args.flows:
+            result = run_flow(profiler, name, args.repeat)
+            run['flows'][name] = result
+            report(name, result, bench.previous_flow(history, name))
+
+    if not args.no_save:
+        bench.append_history(args.output, run)
+        print('Saved to %s' % args.output)
+
+if __name__ == '__main__':
+    main()
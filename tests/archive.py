@@ -0,0 +1,218 @@
+# archive.py -- EtherEx tick archive tests
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from pyetherex import archive
+
+class TestTickArchive(object):
+
+    ETX = "0x" + "e559de5527492bcb42ec68d07df0742a98ec3f1e"
+    ALICE = "0x" + "a94f5374fce5edbc8e2a8697c15331677e6ebf0b"
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.root)
+
+    def write_ticks(self, count=10):
+        with archive.TickWriter(self.root, 1) as writer:
+            for i in range(count):
+                writer.append(100 + i // 2, 1420000000 + i * 10, archive.FILL, 1 + i % 2, 25000000, (i + 1) * 10 ** 5, self.ALICE)
+
+    def test_empty(self):
+        with archive.TickReader(self.root, 1) as reader:
+            assert len(reader) == 0
+            assert reader.block_range(0, 1000) == (0, 0)
+
+    def test_append_and_read(self):
+        self.write_ticks()
+
+        with archive.TickReader(self.root, 1) as reader:
+            assert len(reader) == 10
+            assert reader[0] == {
+                'block': 100,
+                'timestamp': 1420000000,
+                'event': archive.FILL,
+                'type': 1,
+                'price': 25000000,
+                'amount': 10 ** 5,
+                'owner': archive._owner_bytes(self.ALICE)
+            }
+            assert reader[-1]['amount'] == 10 * 10 ** 5
+            assert os.path.getsize(os.path.join(self.root, "1", "block.col")) == 10 * 8
+            assert os.path.getsize(os.path.join(self.root, "1", "owner.col")) == 10 * 20
+
+    def test_resume_appending(self):
+        self.write_ticks(4)
+
+        with archive.TickWriter(self.root, 1) as writer:
+            assert writer.count == 4
+            assert writer.last_block == 101
+            writer.append(102, 1420000100, archive.CANCEL, 2, 25000000, 10 ** 5)
+
+        with archive.TickReader(self.root, 1) as reader:
+            assert len(reader) == 5
+            assert reader[4]['event'] == archive.CANCEL
+            assert reader[4]['owner'] == b'\x00' * 20
+
+    def test_partial_row_is_dropped(self):
+        self.write_ticks(3)
+
+        # Simulate a crash after writing only the first column
+        with open(os.path.join(self.root, "1", "block.col"), 'ab') as f:
+            f.write(b'\x00' * 8)
+
+        with archive.TickReader(self.root, 1) as reader:
+            assert len(reader) == 3
+
+        with archive.TickWriter(self.root, 1) as writer:
+            writer.append(200, 1420001000, archive.ADD, 1, 1, 1)
+
+        with archive.TickReader(self.root, 1) as reader:
+            assert len(reader) == 4
+            assert reader[3]['block'] == 200
+
+    def test_out_of_order_block(self):
+        self.write_ticks(4)
+
+        with archive.TickWriter(self.root, 1) as writer:
+            with pytest.raises(ValueError):
+                writer.append(99, 1420000100, archive.FILL, 1, 1, 1)
+
+    def test_amount_out_of_range(self):
+        with archive.TickWriter(self.root, 1) as writer:
+            with pytest.raises(ValueError):
+                writer.append(1, 1, archive.FILL, 1, 1, 2 ** 64)
+
+    def test_block_and_time_ranges(self):
+        self.write_ticks()
+
+        with archive.TickReader(self.root, 1) as reader:
+            assert reader.block_range(101, 103) == (2, 6)
+            assert reader.block_range(0, 100) == (0, 0)
+            assert reader.block_range(104, 1000) == (8, 10)
+            assert reader.time_range(1420000015, 1420000040) == (2, 4)
+
+    @pytest.mark.skipif(archive.numpy is None, reason="numpy not installed")
+    def test_numpy_views(self):
+        self.write_ticks()
+
+        with archive.TickReader(self.root, 1) as reader:
+            ticks = reader.blocks(101, 103)
+            assert list(ticks['block']) == [101, 101, 102, 102]
+            assert list(ticks['amount']) == [3 * 10 ** 5, 4 * 10 ** 5, 5 * 10 ** 5, 6 * 10 ** 5]
+            assert not ticks['price'].flags.writeable
+            del ticks
+
+    def test_export_logs(self):
+        logs = [{
+            'number': 100 + i,
+            'data': hex(1420000000 + i),
+            'topics': ["0x" + "0" * 24 + self.ETX[2:], "0x1", hex(25000000), hex(10 ** 5)]
+        } for i in range(3)]
+        logs.append({'number': 104, 'data': '0x1', 'topics': ["0x" + "1" * 40, "0x1", "0x1", "0x1"]})
+
+        assert archive.export_logs(self.root, logs, {self.ETX: 1}) == {1: 3}
+
+        with archive.TickReader(self.root, 1) as reader:
+            assert len(reader) == 3
+            assert reader[2]['block'] == 102
+            assert reader[2]['timestamp'] == 1420000002
+            assert reader[2]['price'] == 25000000
+
+    def test_export_order_events(self):
+        BOB = "0x" + "b" * 40
+        etx = "0x" + "0" * 24 + self.ETX[2:]
+
+        def price_log(block, type, amount):
+            return {'number': block, 'data': hex(1420000000 + block), 'topics': [etx, hex(type), hex(25000000), hex(amount)]}
+
+        def book_log(block, trade_id, amount):
+            return {'number': block, 'data': hex(amount), 'topics': ["0x1", hex(trade_id)]}
+
+        logs = [
+            book_log(100, 0xaa, 500),                           # Alice adds a buy
+            book_log(100, 0xbb, 200),                           # Bob adds a sell
+            book_log(100, 0xcc, 100),                           # Unknown trade
+            price_log(101, 1, 300), book_log(101, 0xaa, 200),   # Partial fill
+            book_log(102, 0xbb, 0),                             # Bob cancels
+            price_log(103, 1, 200), book_log(103, 0xaa, 0),     # Rest of the fill
+            price_log(104, 2, 50)                               # Signed order fill
+        ]
+        trades = {
+            "0xaa": {'type': 1, 'price': 25000000, 'owner': self.ALICE},
+            0xbb: {'type': 2, 'price': 26000000, 'owner': BOB}
+        }
+
+        assert archive.export_logs(self.root, logs, {self.ETX: 1}, trades) == {1: 6}
+
+        with archive.TickReader(self.root, 1) as reader:
+            ticks = [reader[i] for i in range(len(reader))]
+
+        assert [(t['block'], t['event'], t['type'], t['amount']) for t in ticks] == [
+            (100, archive.ADD, 1, 500),
+            (100, archive.ADD, 2, 200),
+            (101, archive.FILL, 1, 300),
+            (102, archive.CANCEL, 2, 200),
+            (103, archive.FILL, 1, 200),
+            (104, archive.FILL, 2, 50)]
+        assert ticks[0]['owner'] == ticks[2]['owner'] == archive._owner_bytes(self.ALICE)
+        assert ticks[3]['owner'] == archive._owner_bytes(BOB)
+        assert ticks[3]['price'] == 26000000
+        assert ticks[3]['timestamp'] == 1420000101
+        assert ticks[5]['owner'] == b'\x00' * 20
+
+        # Newest first, as eth_logs returns them, gives the same ticks
+        root = os.path.join(self.root, "newest")
+        assert archive.export_logs(root, list(reversed(logs)), {self.ETX: 1}, trades) == {1: 6}
+        with archive.TickReader(root, 1) as reader:
+            assert [(reader[i]['block'], reader[i]['event']) for i in range(len(reader))] == [
+                (t['block'], t['event']) for t in ticks]
+
+    def test_export_signed_fill_before_add(self):
+        CAROL = "0x" + "c" * 40
+        etx = "0x" + "0" * 24 + self.ETX[2:]
+
+        def price_log(block, type, amount, **entry):
+            return dict(entry, number=block, data=hex(1420000000 + block), topics=[etx, hex(type), hex(25000000), hex(amount)])
+
+        def book_log(block, trade_id, amount, **entry):
+            return dict(entry, number=block, data=hex(amount), topics=["0x1", hex(trade_id)])
+
+        trades = {
+            0xaa: {'type': 1, 'price': 25000000, 'owner': self.ALICE},
+            0xdd: {'type': 2, 'price': 25000000, 'owner': CAROL}
+        }
+
+        # A signed order fill, then Carol adds a trade in the same block
+        cases = {
+            "amounts": [book_log(100, 0xaa, 500), price_log(101, 2, 200), book_log(101, 0xdd, 300),
+                        price_log(102, 1, 100), book_log(102, 0xaa, 400)],
+            "transactions": [book_log(100, 0xaa, 500, transactionHash="0x1"),
+                             price_log(101, 2, 200, transactionHash="0x2"),
+                             book_log(101, 0xdd, 300, transactionHash="0x3"),
+                             price_log(102, 1, 100, transactionHash="0x4"),
+                             book_log(102, 0xaa, 400, transactionHash="0x4")]
+        }
+        for name, logs in cases.items():
+            root = os.path.join(self.root, name)
+            assert archive.export_logs(root, logs, {self.ETX: 1}, trades) == {1: 4}
+
+            with archive.TickReader(root, 1) as reader:
+                ticks = [reader[i] for i in range(len(reader))]
+
+            assert [(t['block'], t['event'], t['amount']) for t in ticks] == [
+                (100, archive.ADD, 500), (101, archive.FILL, 200), (101, archive.ADD, 300), (102, archive.FILL, 100)]
+            assert ticks[1]['owner'] == b'\x00' * 20
+            assert ticks[2]['owner'] == archive._owner_bytes(CAROL)
+            assert ticks[3]['owner'] == archive._owner_bytes(self.ALICE)
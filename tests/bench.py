@@ -0,0 +1,163 @@
+# bench.py -- EtherEx benchmark instrumentation tests
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from pyetherex import bench
+
+class Chain(object):
+
+    def __init__(self):
+        self.storage = {}
+
+    def send(self, key, value):
+        # Storage reads made while sending are charged to send
+        self.get_storage_data(key)
+        self.storage[key] = value
+        return value
+
+    def get_storage_data(self, key):
+        return self.storage.get(key, 0)
+
+    def mine(self, n=1):
+        return [bytearray(1024) for _ in range(n)]
+
+class TestProfiler(object):
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+        self.profiler = bench.Profiler(memory=False)
+        self.profiler.patch(Chain, 'send', 'send')
+        self.profiler.patch(Chain, 'get_storage_data', 'storage')
+        self.profiler.patch(Chain, 'mine', 'mine')
+
+    def teardown_method(self, method):
+        self.profiler.restore()
+        shutil.rmtree(self.root)
+
+    def flow(self):
+        chain = Chain()
+        for i in range(3):
+            chain.send(i, i * 10)
+        chain.mine(2)
+        assert chain.get_storage_data(2) == 20
+
+    def test_phases(self):
+        result = self.profiler.run(self.flow)
+
+        phases = result['phases']
+        assert phases['send']['calls'] == 3
+        assert phases['storage']['calls'] == 1
+        assert phases['mine']['calls'] == 1
+        assert phases['compile']['calls'] == 0
+        assert phases['deploy']['calls'] == 0
+
+        total = sum(stats['time'] for stats in phases.values()) + result['other']
+        assert abs(total - result['wall']) < 1e-6
+        assert result['peak'] is None
+
+    def test_reset_between_runs(self):
+        self.profiler.run(self.flow)
+        result = self.profiler.run(self.flow)
+        assert result['phases']['send']['calls'] == 3
+
+    def test_restore(self):
+        wrapped = Chain.send
+        self.profiler.restore()
+
+        assert Chain.send is not wrapped
+        assert Chain.__dict__['send'] is not wrapped
+        Chain().send(1, 2)
+        assert self.profiler.phases['send']['calls'] == 0
+
+    def test_exception(self):
+        def fail():
+            Chain().send([], 1)
+
+        with pytest.raises(TypeError):
+            self.profiler.run(fail)
+        assert self.profiler.depth == 0
+        assert self.profiler.phases['send']['calls'] == 1
+
+    @pytest.mark.skipif(bench.tracemalloc is None, reason="needs tracemalloc.reset_peak")
+    def test_memory(self):
+        self.profiler.memory = 'tracemalloc'
+        result = self.profiler.run(self.flow)
+
+        assert result['memory'] == 'tracemalloc'
+        assert result['phases']['mine']['peak'] >= 2048
+        assert result['peak'] >= result['phases']['mine']['peak']
+        assert not bench.tracemalloc.is_tracing()
+
+    @pytest.mark.skipif(bench.resource is None, reason="needs the resource module")
+    def test_rusage_memory(self):
+        self.profiler.memory = 'rusage'
+
+        def flow():
+            # Raises the process' maximum resident size by about 128 MiB
+            Chain().mine(128 * 1024)
+
+        result = self.profiler.run(flow)
+
+        assert result['memory'] == 'rusage'
+        assert result['phases']['mine']['peak'] >= 32 * 1024 * 1024
+        assert result['peak'] >= result['phases']['mine']['peak']
+        assert result['phases']['send']['peak'] is None
+
+    @pytest.mark.skipif(bench.resource is None or not hasattr(os, 'fork'), reason="needs resource and fork")
+    def test_forked_memory(self):
+        self.profiler.memory = 'rusage'
+
+        def flow():
+            Chain().mine(128 * 1024)
+
+        # Each child starts from the parent's current resident size, so an
+        # earlier run doesn't hide what the next one allocates
+        peaks = []
+        for run in range(3):
+            result = bench.run_forked(self.profiler, flow)
+            assert result['phases']['mine']['calls'] == 1
+            peaks.append(result['phases']['mine']['peak'])
+        assert min(peaks) > 0
+        assert max(peaks) - min(peaks) <= 1024 * 1024
+        assert self.profiler.phases['mine']['calls'] == 0
+
+        with pytest.raises(RuntimeError):
+            bench.run_forked(self.profiler, lambda: Chain().send([], 1))
+
+    def test_compare_memory(self):
+        before = dict(self.profiler.run(self.flow), memory='rusage', peak=100)
+        after = dict(before, memory='tracemalloc', peak=200)
+        assert bench.compare(before, after)['peak'] is None
+        assert bench.compare(before, dict(before, peak=200))['peak'] == 1.0
+
+    def test_history(self):
+        path = os.path.join(self.root, "benchmarks.json")
+        assert bench.load_history(path) == []
+        assert bench.previous_flow([], 'flow') is None
+
+        first = self.profiler.run(self.flow)
+        bench.append_history(path, {'revision': 'a', 'flows': {'flow': first}})
+        second = self.profiler.run(self.flow)
+        history = bench.append_history(path, {'revision': 'b', 'flows': {'flow': second}})
+
+        assert [run['revision'] for run in bench.load_history(path)] == ['a', 'b']
+        assert bench.previous_flow(history, 'flow') == second
+        assert bench.previous_flow(history, 'other') is None
+
+    def test_compare(self):
+        before = self.profiler.run(self.flow)
+        after = dict(before, wall=before['wall'] * 2)
+
+        changes = bench.compare(before, after)
+        assert abs(changes['wall'] - 1.0) < 1e-9
+        assert changes['peak'] is None
+        assert changes['compile'] is None
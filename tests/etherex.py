@@ -8,11 +8,31 @@
 from pyethereum import tester
 from pyethereum.utils import sha3
 import logging as logger
+import random
 
 # DEBUG
 # tester.enable_logging()
 # tester.pb.pblogger.log_op = True
 
+# ETH value of a trade as the exchange computed it before the value scale
+# was precomputed, next to the current eth_value, on the same market layout
+VALUE_GAS = """
+data markets[2^160](id, name, contract, decimals, precision, minimum, last_price, owner, block, total_trades, scale, divisor)
+
+def add_market(decimals, precision, scale, divisor):
+    self.markets[1].decimals = decimals
+    self.markets[1].precision = precision
+    self.markets[1].scale = scale
+    self.markets[1].divisor = divisor
+    return(1)
+
+def old_value(amount, price, market_id):
+    return(((amount * price) / (self.markets[market_id].precision * 10 ^ self.markets[market_id].decimals)) * 10 ^ 18)
+
+def new_value(amount, price, market_id):
+    return((amount * price * self.markets[market_id].scale) / self.markets[market_id].divisor)
+"""
+
 class TestEtherEx(object):
 
     ALICE = { 'address': tester.a0, 'key': tester.k0 }
@@ -43,6 +63,8 @@ class TestEtherEx(object):
     CHANGE_OWNERSHIP = 12
     NAME_REGISTER = 13
     NAME_UNREGISTER = 14
+    GET_MARKETS = 15
+    GET_USER_SUMMARY = 16
 
     # Utilities
     def hex_pad(self, x):
@@ -60,6 +82,22 @@ class TestEtherEx(object):
     def _storage(self, contract, idx):
         return self.state.block.account_to_dict(contract)['storage'].get(idx)
 
+    def _value(self, amount, price, scale, divisor):
+        # Same as the contract's eth_value macro
+        return amount * price * scale // divisor
+
+    def _remaining(self, market_id, trade_id):
+        # Remaining amount from the latest book log of a trade
+        topics = [market_id, trade_id % 2 ** 256]
+        logs = [log for log in self.state.block.logs if [topic % 2 ** 256 for topic in log.topics] == topics]
+        assert logs
+        return int(logs[-1].data.encode('hex'), 16)
+
+    def _gas(self, *args, **kwargs):
+        gas_used = self.state.block.gas_used
+        ans = self.state.send(*args, **kwargs)
+        return ans, self.state.block.gas_used - gas_used
+
     # Setup
     def setup_method(self, method):
         self.state = tester.state()
@@ -145,6 +183,8 @@ class TestEtherEx(object):
         assert self._storage(self.contract, self.ptr_add(self.ptr, 6)) == self.xhex(1) # Last price
         assert self._storage(self.contract, self.ptr_add(self.ptr, 7)) == "0x" + self.ALICE['address'] # Owner
         assert self._storage(self.contract, self.ptr_add(self.ptr, 8)) == block # Block #
+        assert self._storage(self.contract, self.ptr_add(self.ptr, 10)) == self.xhex(10 ** 5) # Value scale
+        assert self._storage(self.contract, self.ptr_add(self.ptr, 11)) == self.xhex(1) # Value divisor
 
 
     def test_change_ownership(self):
@@ -410,6 +450,53 @@ class TestEtherEx(object):
         assert ans == [1]
         assert self._storage(self.bob_contract, self.xhex(1)) == "0x" + self.contract
 
+    def test_get_markets(self):
+        self.test_add_bob_coin()
+
+        etx = [1, 4543576, int(self.etx_contract, 16), 5, 10 ** 8, 10 ** 18, 1, int(self.ALICE['address'], 16), 0, 0]
+        bob = [2, 4345666, int(self.bob_contract, 16), 4, 10 ** 8, 10 ** 18, 1, int(self.BOB['address'], 16), 0, 0]
+
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.contract,
+            0,
+            funid=self.GET_MARKETS,
+            abi=[1, 10])
+        assert ans == etx + bob
+
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.contract,
+            0,
+            funid=self.GET_MARKETS,
+            abi=[2, 1])
+        assert ans == bob
+
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.contract,
+            0,
+            funid=self.GET_MARKETS,
+            abi=[3, 1])
+        assert ans == [0]
+
+    def test_get_user_summary(self):
+        self.test_add_bob_coin()
+        self.test_add_sell_trades(init=False)
+
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.contract,
+            0,
+            funid=self.GET_USER_SUMMARY,
+            abi=[self.ALICE['address']])
+        assert len(ans) == 2 * 12
+        assert ans[0] == 1
+        assert ans[9] == 1 # Total trades
+        assert ans[10:12] == [500 * 10 ** 5, 500 * 10 ** 5] # Available, trading
+        assert ans[12] == 2
+        assert ans[22:24] == [0, 0]
+
     def test_insufficient_buy_trade(self):
         self.test_initialize()
 
@@ -543,6 +630,221 @@ class TestEtherEx(object):
         #     assert self._storage(self.tcontract, x) == None
         # assert len(self.state.block.get_transactions()) == 17
 
+    def test_book_logs(self):
+        self.test_initialize()
+        self.test_transfer_to_bob_and_deposit()
+
+        # Add
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.contract,
+            130 * 10 ** 18,
+            funid=self.BUY,
+            abi=[500 * 10 ** 5, int(0.26 * 10 ** 8), 1])
+        trade_id = ans[0]
+        assert self._remaining(1, trade_id) == 500 * 10 ** 5
+        self.state.mine(1)
+
+        # Partial fill
+        ans = self.state.send(
+            self.BOB['key'],
+            self.contract,
+            0,
+            funid=self.TRADE,
+            abi=[trade_id, 100 * 10 ** 5])
+        assert ans == [1]
+        assert self._remaining(1, trade_id) == 400 * 10 ** 5
+
+        # Cancel
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.contract,
+            0,
+            funid=self.CANCEL,
+            abi=[trade_id])
+        assert ans == [1]
+        assert self._remaining(1, trade_id) == 0
+
+    #
+    # Value rounding
+    #
+
+    # 10 ^ 18 / (3 * 10 ^ 7 * 10 ^ 4) reduced, does not divide evenly
+    ODD_SCALE = 10 ** 7
+    ODD_DIVISOR = 3
+    ODD_PRICE = 7 * 10 ** 7 + 1
+
+    def setup_odd_market(self):
+        self.test_initialize()
+
+        # Register BOB with a price precision that does not divide 10 ^ 18 evenly
+        ans = self.state.send(
+            self.BOB['key'],
+            self.contract,
+            0,
+            funid=self.ADD_MARKET,
+            abi=["0x" + "BOB".encode('hex'), self.bob_contract, 4, 3 * 10 ** 7, 10 ** 18])
+        assert ans == [1]
+
+        ans = self.state.send(
+            self.ALICE['key'],
+            self.bob_contract,
+            0,
+            funid=2,
+            abi=[self.contract, 2])
+        assert ans == [1]
+
+        # Deposit BOB for Bob and Charlie
+        for user in [self.BOB, self.CHARLIE]:
+            ans = self.state.send(
+                self.ALICE['key'],
+                self.bob_contract,
+                0,
+                funid=0,
+                abi=[user['address'], 10 ** 6])
+            assert ans == [1]
+            ans = self.state.send(
+                user['key'],
+                self.bob_contract,
+                0,
+                funid=0,
+                abi=[self.contract, 10 ** 6])
+            assert ans == [1]
+
+    def test_buy_partial_fills_leave_no_dust(self):
+        self.setup_odd_market()
+        rng = random.Random(29)
+
+        for run in range(5):
+            snapshot = self.state.snapshot()
+
+            amount = rng.randint(50000, 150000)
+            value = self._value(amount, self.ODD_PRICE, self.ODD_SCALE, self.ODD_DIVISOR)
+
+            ans = self.state.send(
+                self.ALICE['key'],
+                self.contract,
+                value,
+                funid=self.BUY,
+                abi=[amount, self.ODD_PRICE, 2])
+            trade_id = ans[0]
+            assert self.state.block.get_balance(self.contract) == value
+            self.state.mine(1)
+
+            # Fill in random chunks, each above the minimum trade value
+            left = amount
+            while left:
+                fill = min(left, rng.randint(5000, 40000))
+                if left - fill < 5000:
+                    fill = left
+
+                ans = self.state.send(
+                    self.BOB['key'],
+                    self.contract,
+                    0,
+                    funid=self.TRADE,
+                    abi=[trade_id, fill])
+                assert ans == [1]
+
+                left -= fill
+                assert self.state.block.get_balance(self.contract) == self._value(left, self.ODD_PRICE, self.ODD_SCALE, self.ODD_DIVISOR)
+
+            assert self.state.block.get_balance(self.contract) == 0
+            self.state.revert(snapshot)
+
+    def test_sell_partial_fills_leave_no_dust(self):
+        self.setup_odd_market()
+        rng = random.Random(29)
+
+        for run in range(5):
+            snapshot = self.state.snapshot()
+
+            # Charlie sells, sends nothing else and isn't the coinbase collecting fees
+            amount = rng.randint(50000, 150000)
+            ans = self.state.send(
+                self.CHARLIE['key'],
+                self.contract,
+                0,
+                funid=self.SELL,
+                abi=[amount, self.ODD_PRICE, 2])
+            trade_id = ans[0]
+            self.state.mine(1)
+
+            charlie_balance = self.state.block.get_balance(self.CHARLIE['address'])
+
+            # Pay in random chunks, the last one overpaying
+            left = amount
+            while left:
+                paying = rng.randint(10 ** 18, 3 * 10 ** 19)
+                tradevalue = self._value(left, self.ODD_PRICE, self.ODD_SCALE, self.ODD_DIVISOR)
+                if paying < tradevalue:
+                    fill = paying * self.ODD_DIVISOR // (self.ODD_PRICE * self.ODD_SCALE)
+                else:
+                    fill = left
+
+                ans = self.state.send(
+                    self.BOB['key'],
+                    self.contract,
+                    paying,
+                    funid=self.TRADE,
+                    abi=[trade_id, 0])
+                assert ans == [1]
+
+                left -= fill
+                ans = self.state.send(
+                    self.BOB['key'],
+                    self.contract,
+                    0,
+                    funid=self.GET_SUB_BALANCE,
+                    abi=[self.CHARLIE['address'], 2])
+                assert ans == [10 ** 6 - amount, left]
+
+            # Charlie got exactly the order's value, nothing stayed in the exchange
+            received = self.state.block.get_balance(self.CHARLIE['address']) - charlie_balance
+            assert received == self._value(amount, self.ODD_PRICE, self.ODD_SCALE, self.ODD_DIVISOR)
+            assert self.state.block.get_balance(self.contract) == 0
+            self.state.revert(snapshot)
+
+    def test_value_gas(self):
+        self.test_add_buy_trades()
+        self.test_transfer_to_bob_and_deposit()
+        self.state.mine(1)
+
+        _, buy_gas = self._gas(
+            self.ALICE['key'],
+            self.contract,
+            130 * 10 ** 18,
+            funid=self.BUY,
+            abi=[500 * 10 ** 5, int(0.26 * 10 ** 8), 1])
+        ans, fill_gas = self._gas(
+            self.BOB['key'],
+            self.contract,
+            0,
+            funid=self.TRADE,
+            abi=[23490291715255176443338864873375620519154876621682055163056454432194948412040L, 100 * 10 ** 5])
+        assert ans == [1]
+        ans, cancel_gas = self._gas(
+            self.ALICE['key'],
+            self.contract,
+            0,
+            funid=self.CANCEL,
+            abi=[23490291715255176443338864873375620519154876621682055163056454432194948412040L])
+        assert ans == [1]
+
+        logger.info("Gas used: buy %d, partial fill %d, cancel %d" % (buy_gas, fill_gas, cancel_gas))
+
+        # Same value, less gas than computing the ratio on every trade
+        values = self.state.contract(VALUE_GAS)
+        assert self.state.send(self.ALICE['key'], values, 0, funid=0, abi=[5, 10 ** 8, 10 ** 5, 1]) == [1]
+
+        abi = [500 * 10 ** 5, int(0.26 * 10 ** 8), 1]
+        old, old_gas = self._gas(self.ALICE['key'], values, 0, funid=1, abi=abi)
+        new, new_gas = self._gas(self.ALICE['key'], values, 0, funid=2, abi=abi)
+        assert old == new == [130 * 10 ** 18]
+
+        logger.info("Value gas: before %d, now %d" % (old_gas, new_gas))
+        assert new_gas < old_gas
+
     def test_basic_hft_prevention_using_block_number_fail(self):
         self.test_add_buy_trades()
 
@@ -0,0 +1,226 @@
+# relay.py -- EtherEx signed order relay tests
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+import pytest
+
+from pyetherex import relay
+
+tester = relay.tester
+
+# Taker that re-enters trade_signed with the same order whenever the
+# exchange sends it ETH
+REENTRANT = """
+extern etherex: [price, buy, sell, trade, deposit, withdraw, cancel, add_market, get_market, get_trade_ids, get_trade, get_sub_balance, change_ownership, register, unregister, get_markets, get_user_summary, trade_signed]
+
+data exchange
+data order[10]
+data depth
+
+def receive():
+    if msg.sender == self.exchange and self.depth < 3:
+        self.depth += 1
+        self.exchange.trade_signed(self.order[0], self.order[1], self.order[2], self.order[3], self.order[4], self.order[5], self.order[6], self.order[7], self.order[8], self.order[9], value=msg.value, as=etherex)
+
+def attack(exchange, market_id, type, amount, price, expiry, nonce, v, r, s, max_amount):
+    self.exchange = exchange
+    self.order[0] = market_id
+    self.order[1] = type
+    self.order[2] = amount
+    self.order[3] = price
+    self.order[4] = expiry
+    self.order[5] = nonce
+    self.order[6] = v
+    self.order[7] = r
+    self.order[8] = s
+    self.order[9] = max_amount
+    return(self.exchange.trade_signed(market_id, type, amount, price, expiry, nonce, v, r, s, max_amount, value=msg.value, as=etherex))
+"""
+
+@pytest.mark.skipif(tester is None, reason="pyethereum not installed")
+class TestRelay(object):
+
+    etherex = 'contracts/etherex.se'
+    etx = 'contracts/etx.se'
+
+    GET_SUB_BALANCE = 11
+
+    PRICE = int(0.25 * 10 ** 8)
+
+    def setup_method(self, method):
+        self.state = tester.state()
+        self.contract = self.state.contract(self.etherex)
+        self.etx_contract = self.state.contract(self.etx)
+
+        # Register ETX and deposit 1000 for Alice
+        assert self.state.send(tester.k0, self.contract, 0, funid=7, abi=["0x" + "ETX".encode('hex'), self.etx_contract, 5, 10 ** 8, 10 ** 18]) == [1]
+        assert self.state.send(tester.k0, self.etx_contract, 0, funid=2, abi=[self.contract, 1]) == [1]
+        assert self.state.send(tester.k0, self.etx_contract, 0, funid=0, abi=[self.contract, 1000 * 10 ** 5]) == [1]
+
+        self.relay = relay.Relay(self.state, self.contract)
+        self.expiry = self.state.block.number + 10
+
+    def sign(self, key, type, amount, price=PRICE, nonce=0, expiry=None):
+        return relay.sign_order(key, self.contract, 1, type, amount, price, expiry or self.expiry, nonce)
+
+    def sub_balance(self, address):
+        return self.state.send(tester.k0, self.contract, 0, funid=self.GET_SUB_BALANCE, abi=[address, 1])
+
+    def test_sign_and_recover(self):
+        order = self.sign(tester.k1, relay.BUY, 10 ** 5)
+        assert order['maker'] == tester.a1
+        assert relay.recover(order) == tester.a1
+
+        order['amount'] += 1
+        assert relay.recover(order) != tester.a1
+
+    def test_submit_rejects(self):
+        order = self.sign(tester.k0, relay.SELL, 10 ** 5)
+        order['price'] += 1
+        with pytest.raises(relay.RelayError):
+            self.relay.submit(order)
+
+        expired = self.sign(tester.k0, relay.SELL, 10 ** 5, expiry=self.state.block.number - 1)
+        with pytest.raises(relay.RelayError):
+            self.relay.submit(expired)
+
+        other = relay.sign_order(tester.k0, self.etx_contract, 1, relay.SELL, 10 ** 5, self.PRICE, self.expiry, 0)
+        with pytest.raises(relay.RelayError):
+            self.relay.submit(other)
+
+        order_hash = self.relay.submit(self.sign(tester.k0, relay.SELL, 10 ** 5))
+        with pytest.raises(relay.RelayError):
+            self.relay.submit(self.relay.orders[order_hash])
+
+    def test_book_priority(self):
+        first = self.relay.submit(self.sign(tester.k0, relay.SELL, 10 ** 5, self.PRICE))
+        cheaper = self.relay.submit(self.sign(tester.k0, relay.SELL, 10 ** 5, self.PRICE - 1))
+        second = self.relay.submit(self.sign(tester.k0, relay.SELL, 10 ** 5, self.PRICE, nonce=1))
+        low = self.relay.submit(self.sign(tester.k1, relay.BUY, 10 ** 5, self.PRICE - 2))
+        high = self.relay.submit(self.sign(tester.k1, relay.BUY, 10 ** 5, self.PRICE - 1))
+
+        assert [o['hash'] for o in self.relay.book(1, relay.SELL)] == [cheaper, first, second]
+        assert [o['hash'] for o in self.relay.book(1, relay.BUY)] == [high, low]
+        assert self.relay.best(1, relay.BUY)['hash'] == high
+
+        self.relay.remove(first)
+        assert [o['hash'] for o in self.relay.book(1, relay.SELL)] == [cheaper, second]
+
+    def test_fill_sell(self):
+        # Alice sells 100 ETX for 25 ETH, no storage used until filled
+        order_hash = self.relay.submit(self.sign(tester.k0, relay.SELL, 100 * 10 ** 5))
+        assert self.sub_balance(tester.a0) == [1000 * 10 ** 5, 0]
+
+        other = self.relay.submit(self.sign(tester.k0, relay.SELL, 10 ** 5, nonce=1))
+
+        # Bob buys 40, sending more than that is worth, only that order is checked
+        calls = []
+        call = self.relay._call
+        self.relay._call = lambda *args: calls.append(args) or call(*args)
+        assert self.relay.fill(tester.k1, order_hash, 40 * 10 ** 5, 20 * 10 ** 18) == 1
+        assert len(calls) == 1
+        assert self.sub_balance(tester.a0) == [960 * 10 ** 5, 0]
+        assert self.sub_balance(tester.a1) == [40 * 10 ** 5, 0]
+        assert self.relay.orders[order_hash]['filled'] == 40 * 10 ** 5
+
+        # Then the rest, the order leaves the book
+        order = self.relay.orders[order_hash]
+        assert self.relay.fill(tester.k1, order_hash, 100 * 10 ** 5, 15 * 10 ** 18) == 1
+        assert self.sub_balance(tester.a1) == [100 * 10 ** 5, 0]
+        assert [o['hash'] for o in self.relay.book(1, relay.SELL)] == [other]
+
+        # ETH went straight to Alice
+        assert self.state.block.get_balance(self.contract) == 0
+
+        # Filling it again fails
+        abi = [order[field] for field in relay.ORDER_FIELDS] + [order['v'], order['r'], order['s'], 10 ** 5]
+        assert self.state.send(tester.k1, self.contract, 10 ** 18, funid=relay.TRADE_SIGNED, abi=abi) == [19]
+
+    def test_fill_reentrant(self):
+        # Alice sells 100 ETX, the taker pays for all of it and more but
+        # only takes 60 per fill, re-entering from every refund
+        order = self.sign(tester.k0, relay.SELL, 100 * 10 ** 5)
+        order_hash = self.relay.submit(order)
+        taker = self.state.contract(REENTRANT, sender=tester.k1)
+
+        abi = [self.contract] + [order[field] for field in relay.ORDER_FIELDS] + [order['v'], order['r'], order['s'], 60 * 10 ** 5]
+        assert self.state.send(tester.k1, taker, 100 * 10 ** 18, funid=1, abi=abi) == [1]
+
+        status = self.relay.status(self.relay.orders[order_hash])
+        assert status['filled'] <= order['amount']
+        assert status['filled'] == 100 * 10 ** 5
+        assert self.sub_balance(tester.a0) == [900 * 10 ** 5, 0]
+        assert self.sub_balance(taker) == [100 * 10 ** 5, 0]
+        assert self.state.block.get_balance(self.contract) == 0
+
+    def test_fill_buy(self):
+        # Bob escrows 30 ETH and buys 100 ETX for 25 ETH
+        assert self.state.send(tester.k1, self.contract, 30 * 10 ** 18, funid=relay.DEPOSIT_ETH, abi=[]) == [30 * 10 ** 18]
+        order_hash = self.relay.submit(self.sign(tester.k1, relay.BUY, 100 * 10 ** 5))
+
+        assert self.relay.fill(tester.k0, order_hash, 100 * 10 ** 5) == 1
+        assert self.sub_balance(tester.a0) == [900 * 10 ** 5, 0]
+        assert self.sub_balance(tester.a1) == [100 * 10 ** 5, 0]
+        assert self.relay.book(1, relay.BUY) == []
+
+        assert self.relay.status({'maker': tester.a1, 'hash': order_hash}) == {
+            'filled': 100 * 10 ** 5, 'nonce': 0, 'balance': 5 * 10 ** 18}
+
+        # ETH balances aren't a market, withdraw can't reach them
+        assert self.state.send(tester.k1, self.contract, 0, funid=5, abi=[5 * 10 ** 18, 0]) == [0]
+
+        # Bob withdraws what is left
+        assert self.state.send(tester.k1, self.contract, 0, funid=relay.WITHDRAW_ETH, abi=[6 * 10 ** 18]) == [0]
+        assert self.state.send(tester.k1, self.contract, 0, funid=relay.WITHDRAW_ETH, abi=[5 * 10 ** 18]) == [1]
+        assert self.state.block.get_balance(self.contract) == 0
+
+    def test_fill_buy_unfunded(self):
+        order_hash = self.relay.submit(self.sign(tester.k1, relay.BUY, 100 * 10 ** 5))
+        assert self.relay.fill(tester.k0, order_hash, 100 * 10 ** 5) == 12
+        assert self.sub_balance(tester.a0) == [1000 * 10 ** 5, 0]
+
+    def test_bulk_cancel(self):
+        orders = [self.sign(tester.k0, relay.SELL, 10 ** 5, nonce=nonce) for nonce in range(3)]
+        hashes = [self.relay.submit(order) for order in orders]
+        bob = self.relay.submit(self.sign(tester.k1, relay.BUY, 10 ** 5))
+
+        # Cancelling reads the chain once, not once per order
+        calls = []
+        call = self.relay._call
+        self.relay._call = lambda *args: calls.append(args) or call(*args)
+
+        assert self.relay.cancel(tester.k0, 2) == 1
+        assert [o['hash'] for o in self.relay.book(1, relay.SELL)] == hashes[2:]
+        assert [o['hash'] for o in self.relay.book(1, relay.BUY)] == [bob]
+        assert len(calls) == 1
+
+        # Lowering the nonce back does nothing
+        assert self.relay.cancel(tester.k0, 1) == 0
+
+        abi = [orders[0][field] for field in relay.ORDER_FIELDS] + [orders[0]['v'], orders[0]['r'], orders[0]['s'], 10 ** 5]
+        assert self.state.send(tester.k1, self.contract, 10 ** 18, funid=relay.TRADE_SIGNED, abi=abi) == [18]
+        with pytest.raises(relay.RelayError):
+            self.relay.submit(orders[1])
+
+    def test_merkle_proofs(self):
+        leaves = [relay.utils.sha3(str(i)) for i in range(7)]
+        for n in range(1, len(leaves) + 1):
+            root = relay.merkle_root(leaves[:n])
+            for i in range(n):
+                proof = relay.merkle_proof(leaves[:n], i)
+                assert relay.verify_proof(leaves[i], i, proof, root)
+                assert not relay.verify_proof(relay.utils.sha3("other"), i, proof, root)
+
+    def test_book_root(self):
+        hashes = [self.relay.submit(self.sign(tester.k0, relay.SELL, 10 ** 5, nonce=nonce)) for nonce in range(3)]
+        root = self.relay.root(1)
+
+        index, proof = self.relay.proof(hashes[1])
+        assert index == 1
+        assert relay.verify_proof(relay.binascii.unhexlify(hashes[1]), index, proof, root)
+
+        self.relay.cancel(tester.k0, 1)
+        assert self.relay.root(1) != root
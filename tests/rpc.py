@@ -0,0 +1,207 @@
+# rpc.py -- EtherEx JSON-RPC client tests
+#
+# Copyright (c) 2014 EtherEx
+#
+# This software may be modified and distributed under the terms
+# of the MIT license.  See the LICENSE file for details.
+
+import random
+import threading
+import time
+
+import pytest
+
+from pyetherex import rpc
+from pyetherex import server
+
+try:
+    from pyethereum import tester
+except ImportError:
+    tester = None
+
+class TestRPCClient(object):
+
+    def setup_method(self, method):
+        self.nonces = {}
+        self.sent = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def count_at(address):
+            return hex(self.nonces.get(address, 0))
+
+        def transact(transaction):
+            nonce = int(transaction["nonce"], 16)
+            if nonce != self.nonces.get(transaction["from"], 0):
+                raise ValueError("Invalid nonce")
+            self.nonces[transaction["from"]] = nonce + 1
+            self.sent.append(transaction)
+            return hex(nonce)
+
+        def slow(x):
+            self.release.wait()
+            return x
+
+        self.server = server.RPCServer({
+            "echo": lambda x: x,
+            "slow": slow,
+            "fail": lambda: 1 / 0,
+            "eth_stateAt": lambda address, key: "0x%x" % int(key, 16),
+            "eth_call": lambda transaction: transaction["data"][4:],
+            "eth_countAt": count_at,
+            "eth_transact": transact
+        }).start()
+
+    def teardown_method(self, method):
+        self.release.set()
+        self.server.stop()
+
+    def test_call(self):
+        with rpc.RPCClient(self.server.url) as client:
+            assert client.call("echo", [42]) == 42
+            assert client.state_at("0x00", "0x5").result() == 5
+
+    def test_concurrent_calls_are_batched(self):
+        with rpc.RPCClient(self.server.url, pool_size=1, max_batch=10, batch_delay=0.05) as client:
+            futures = [client.call_async("echo", [i]) for i in range(25)]
+            assert [f.result(5) for f in futures] == list(range(25))
+
+        assert sum(self.server.batches) == 25
+        assert max(self.server.batches) <= 10
+        assert self.server.requests < 25
+
+    def test_errors(self):
+        with rpc.RPCClient(self.server.url) as client:
+            good = client.call_async("echo", [1])
+            bad = client.call_async("fail")
+            missing = client.call_async("nope")
+
+            assert good.result(5) == 1
+            with pytest.raises(rpc.RPCError):
+                bad.result(5)
+            with pytest.raises(rpc.RPCError) as e:
+                missing.result(5)
+            assert e.value.code == -32601
+
+    def test_max_in_flight(self):
+        self.release.clear()
+        client = rpc.RPCClient(self.server.url, max_in_flight=2)
+
+        first = client.call_async("slow", [1])
+        second = client.call_async("slow", [2])
+        third = []
+        t = threading.Thread(target=lambda: third.append(client.call_async("echo", [3])))
+        t.start()
+        t.join(0.1)
+
+        # Blocked until one of the first two completes
+        assert not third
+
+        self.release.set()
+        t.join(5)
+        assert [first.result(5), second.result(5), third[0].result(5)] == [1, 2, 3]
+        client.close()
+
+    def test_contract_call(self):
+        with rpc.RPCClient(self.server.url) as client:
+            # The stand-in echoes the ABI arguments back
+            assert client.contract_call("0x00", 10, [7, "0x2a"]).result(5) == [7, 42]
+
+    def slow_server(self):
+        # Up to 3 ms per request, so requests sent in order can overtake each other
+        handle = self.server.handle
+        def slow_handle(request):
+            time.sleep(random.random() * 0.003)
+            return handle(request)
+        self.server.handle = slow_handle
+
+    def test_pipelined_transactions(self):
+        with rpc.RPCClient(self.server.url, batch_delay=0.05) as client:
+            futures = [client.transact("0xaa", "0xbb", funid=1, args=[i]) for i in range(5)]
+            assert [f.result(5) for f in futures] == ["0x0", "0x1", "0x2", "0x3", "0x4"]
+
+        assert [int(t["nonce"], 16) for t in self.sent] == list(range(5))
+
+    def test_staggered_transactions(self):
+        self.slow_server()
+
+        with rpc.RPCClient(self.server.url) as client:
+            futures = []
+            for i in range(200):
+                futures.append(client.transact("0x%02x" % (i % 3), "0xbb", funid=1, args=[i]))
+                # Reads share the client meanwhile
+                client.call_async("echo", [i])
+                time.sleep(random.random() * 0.0005)
+
+            for f in futures:
+                f.result(5)
+
+        for sender in ("0x00", "0x01", "0x02"):
+            nonces = [int(t["nonce"], 16) for t in self.sent if t["from"] == sender]
+            assert nonces == list(range(len(nonces)))
+        assert len(self.sent) == 200
+
+    def test_nonce_resync(self):
+        self.slow_server()
+
+        for pool_size in (1, 4):
+            self.nonces = {}
+            with rpc.RPCClient(self.server.url, pool_size=pool_size, timeout=5) as client:
+                assert client.transact("0xaa", "0xbb").result(5) == "0x0"
+
+                # Transaction sent from elsewhere
+                self.nonces["0xaa"] = 3
+
+                with pytest.raises(rpc.RPCError):
+                    client.transact("0xaa", "0xbb").result(5)
+                assert client.transact("0xaa", "0xbb").result(5) == "0x3"
+                assert client.call("echo", [1]) == 1
+
+
+@pytest.mark.skipif(tester is None, reason="pyethereum not installed")
+class TestTesterRPC(object):
+
+    etherex = 'contracts/etherex.se'
+    etx = 'contracts/etx.se'
+
+    def setup_method(self, method):
+        self.state = tester.state()
+        self.contract = self.state.contract(self.etherex)
+        self.etx_contract = self.state.contract(self.etx)
+        self.server = server.RPCServer(server.tester_methods(self.state)).start()
+        self.client = rpc.RPCClient(self.server.url)
+        self.exchange = rpc.ExchangeClient(self.client, "0x" + self.contract)
+
+    def teardown_method(self, method):
+        self.client.close()
+        self.server.stop()
+
+    def test_add_market_and_read(self):
+        sender = "0x" + tester.a0
+        futures = [
+            self.client.transact(sender, "0x" + self.contract, funid=7, args=["0x" + "ETX".encode('hex'), "0x" + self.etx_contract, 5, 10 ** 8, 10 ** 18]),
+            self.client.transact(sender, "0x" + self.etx_contract, funid=2, args=["0x" + self.contract, 1])
+        ]
+        for future in futures:
+            future.result(5)
+
+        assert self.exchange.last_market().result(5) == 1
+        market = self.exchange.get_market(1).result(5)
+        assert market[0] == 1
+        assert market[2] == int(self.etx_contract, 16)
+        assert self.client.balance_at(sender).result(5) == self.state.block.get_balance(tester.a0)
+
+        summary = self.exchange.get_user_summary(sender).result(5)
+        assert summary[:10] == market
+        assert summary[10:] == [0, 0]
+
+    def test_batched_trades(self):
+        sender = "0x" + tester.a0
+        self.client.transact(sender, "0x" + self.contract, funid=7, args=["0x" + "ETX".encode('hex'), "0x" + self.etx_contract, 5, 10 ** 8, 10 ** 18]).result(5)
+        trade_ids = []
+        for i in range(5):
+            trade_ids.append(self.state.send(tester.k0, self.contract, 125 * 10 ** 18, funid=1, abi=[(500 + i) * 10 ** 5, int(0.25 * 10 ** 8), 1])[0])
+
+        trades = self.exchange.get_trades(trade_ids)
+        assert [t[0] for t in trades] == [t % 2 ** 256 for t in trade_ids]
+        assert self.server.requests < len(trade_ids) + 2